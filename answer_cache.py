@@ -0,0 +1,108 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# ------------------ KEYS ------------------
+def normalize_text(text):
+    return re.sub(r"\s+", " ", str(text or "")).strip().lower()
+
+
+def profile_fingerprint(profile_bundle):
+    # Changes whenever the profile or advanced Q&A changes, which retires every
+    # answer that was generated from the older version.
+    payload = {
+        "profile": profile_bundle.get("profile", {}),
+        "advanced": profile_bundle.get("advanced", []),
+        "cv": profile_bundle.get("cvRef"),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_key(kind, model, *parts):
+    payload = json.dumps([kind, model] + [normalize_text(p) for p in parts])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ------------------ CACHE ------------------
+class AnswerCache:
+    # Bounded LRU in memory with TTL eviction, optionally backed by a SQLite file
+    # so answers survive restarts.
+    def __init__(self, max_entries=256, ttl=24 * 3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[1]):
+                    entry = (json.loads(row[0]), row[1])
+                    self._store(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        entry = (value, time.time())
+        with self._lock:
+            self._store(key, entry)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO answers (key, value, created) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), entry[1])
+                    )
+                    if self.ttl is not None:
+                        self._conn.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+
+    def get_or_compute(self, key, compute, fresh=False):
+        # `fresh` skips the lookup but still stores the new value.
+        if not fresh:
+            value = self.get(key)
+            if value is not None:
+                return value
+        value = compute()
+        if value:
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM answers")
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
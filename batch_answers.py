@@ -0,0 +1,79 @@
+import asyncio
+import csv
+import io
+import re
+import time
+
+from metrics import METRICS
+
+
+def parse_questions(text, limit=50):
+    # One question per line; numbering/bullets are dropped and repeats removed.
+    questions = []
+    for line in str(text or "").splitlines():
+        question = re.sub(r"^\s*(\d+[.)]|[-•*])\s*", "", line).strip()
+        if question and question not in questions:
+            questions.append(question)
+    return questions[:limit]
+
+
+# ------------------ CONCURRENT GENERATION ------------------
+async def answer_all(questions, answer, concurrency=4, on_result=None):
+    # `answer(question)` is a coroutine returning the answer text. At most
+    # `concurrency` run at once; `on_result(result, done, total)` is called as
+    # each one finishes, in completion order. Returns results in question order.
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index, question):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                text, error = await answer(question), None
+            except Exception as e:
+                text, error = "", str(e)
+        return {
+            "index": index, "question": question, "answer": text, "error": error,
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+
+    results = [None] * len(questions)
+    done = 0
+    for future in asyncio.as_completed([run(i, q) for i, q in enumerate(questions)]):
+        result = await future
+        results[result["index"]] = result
+        done += 1
+        METRICS.incr("batch_answers_failed" if result["error"] else "batch_answers")
+        if on_result:
+            on_result(result, done, len(questions))
+    return results
+
+
+def run_batch(questions, answer, concurrency=4, on_result=None, on_close=None):
+    # Each run gets its own event loop; `on_close()` is awaited before that loop
+    # ends, e.g. to close clients bound to it.
+    async def run():
+        try:
+            return await answer_all(questions, answer, concurrency=concurrency, on_result=on_result)
+        finally:
+            if on_close:
+                await on_close()
+
+    with METRICS.timer("batch_answer_run"):
+        return asyncio.run(run())
+
+
+# ------------------ EXPORT ------------------
+def to_markdown(results, title="Interview answers"):
+    lines = [f"# {title}", ""]
+    for number, result in enumerate(results, start=1):
+        lines += [f"## {number}. {result['question']}", "", result["answer"] or f"_No answer: {result['error']}_", ""]
+    return "\n".join(lines)
+
+
+def to_csv(results):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["question", "answer", "error"])
+    for result in results:
+        writer.writerow([result["question"], result["answer"], result["error"] or ""])
+    return out.getvalue()
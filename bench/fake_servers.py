@@ -0,0 +1,270 @@
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FaultProfile:
+    # Latency is `latency` seconds plus up to `jitter` extra; `failure_rate` of
+    # requests fail with one of `failure_statuses` before any work is done.
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, failure_statuses=(500,)):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_statuses = failure_statuses
+
+    def delay(self):
+        wait = self.latency + random.uniform(0, self.jitter)
+        if wait > 0:
+            time.sleep(wait)
+
+    def failure(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            return random.choice(self.failure_statuses)
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body=b"", headers=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _fault(self, faults=None, body_read=False):
+        server = self.server
+        faults = faults or server.faults
+        faults.delay()
+        status = faults.failure()
+        with server.lock:
+            server.stats["requests"] += 1
+            if status:
+                server.stats["failures"] += 1
+        if status:
+            if not body_read:
+                self._body()
+            self._send(status, json.dumps({"error": {"message": "injected failure"}}).encode("utf-8"))
+            return True
+        return False
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, faults):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.faults = faults or FaultProfile()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "failures": 0}
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their timeout close the socket mid-response; that is expected here.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# ------------------ GIST ------------------
+class _GistHandler(_Handler):
+    def do_GET(self):
+        if self._fault():
+            return
+        server = self.server
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 3 and parts[1] == "raw":
+            # /<id>/raw/<filename>: one file's content, as served by gist raw URLs.
+            with server.lock:
+                content = server.files.get(parts[2])
+                server.stats["raw_gets"] += 1
+                server.stats["bytes_out"] += len(content or "")
+            if content is None:
+                self._send(404, b"Not Found", content_type="text/plain")
+            else:
+                self._send(200, content.encode("utf-8"), content_type="text/plain")
+            return
+        if len(parts) > 2:
+            # /gists/<id>/<version>: one revision from the history.
+            with server.lock:
+                files = server.revisions.get(parts[2])
+            if files is None:
+                self._send(404, b'{"message": "Not Found"}')
+                return
+            self._send(200, json.dumps({"files": server.files_json(files)}).encode("utf-8"))
+            return
+        with server.lock:
+            files, etag = server.files, server.etag
+            server.stats["gets"] += 1
+            if self.headers.get("If-None-Match") == etag:
+                server.stats["not_modified"] += 1
+                not_modified = True
+            else:
+                server.stats["bytes_out"] += sum(len(c) for c in files.values())
+                not_modified = False
+        if not_modified:
+            self._send(304, headers={"ETag": etag})
+            return
+        body = json.dumps({"files": server.files_json(files), "history": server.history_json()})
+        self._send(200, body.encode("utf-8"), headers={"ETag": etag})
+
+    def do_PATCH(self):
+        if self._fault():
+            return
+        server = self.server
+        payload = json.loads(self._body() or b"{}")
+        changes = {name: f["content"] for name, f in payload.get("files", {}).items()}
+        with server.lock:
+            files = server.commit(changes)
+            server.stats["patches"] += 1
+            server.stats["bytes_in"] += sum(len(c) for c in changes.values())
+            etag = server.etag
+            history = server.history_json()
+        body = json.dumps({"files": server.files_json(files), "history": history})
+        self._send(200, body.encode("utf-8"), headers={"ETag": etag})
+
+
+class FakeGistServer(_Server):
+    # Local stand-in for GET/PATCH https://api.github.com/gists/<id>, with ETags,
+    # several files per Gist (a PATCH only replaces the files it names), a
+    # revision history (GET /gists/<id>/<version>) and raw file URLs
+    # (GET /<id>/raw/<filename>).
+    def __init__(self, profiles=None, filename="profiles.json", faults=None, history_size=10):
+        super().__init__(_GistHandler, faults)
+        self.filename = filename
+        self.history_size = history_size
+        self.files = {}
+        self.history = []
+        self.revisions = {}
+        self.commits = 0
+        self.stats.update({"gets": 0, "not_modified": 0, "patches": 0, "raw_gets": 0, "bytes_in": 0, "bytes_out": 0})
+        self.commit({filename: json.dumps(profiles or {})})
+
+    @property
+    def content(self):
+        return self.files.get(self.filename)
+
+    def commit(self, changes):
+        self.commits += 1
+        files = dict(self.files)
+        files.update(changes)
+        version = hashlib.sha1(f"{self.commits}:{json.dumps(files, sort_keys=True)}".encode("utf-8")).hexdigest()
+        self.files = files
+        self.etag = '"%s"' % version
+        self.history.insert(0, version)
+        self.revisions[version] = files
+        for old in self.history[self.history_size:]:
+            self.revisions.pop(old, None)
+        del self.history[self.history_size:]
+        return files
+
+    def files_json(self, files):
+        return {name: {"filename": name, "content": content} for name, content in files.items()}
+
+    def history_json(self):
+        return [{"version": version} for version in self.history]
+
+
+# ------------------ OPENAI ------------------
+def _fake_reply(prompt):
+    count = re.search(r"\b(?:Ask me|Generate) (\d+)", prompt)
+    if "CV parser" in prompt:
+        return json.dumps({
+            "name": "Sam Example", "title": "Engineer", "location": "Leeds",
+            "skills": ["Python", "SQL"], "softSkills": ["Communication"],
+            "experience": ["Built data pipelines"], "certifications": [], "learning": ["Rust"],
+            "goals": "Lead a platform team",
+        })
+    if count and "JSON list" in prompt:
+        n = int(count.group(1))
+        salt = random.randint(0, 10 ** 6)
+        topics = ["leadership", "failure", "mentoring", "conflict", "deadlines", "learning",
+                  "ownership", "feedback", "ambition", "values", "teamwork", "risk"]
+        return json.dumps([
+            f"Question {salt}-{i}: what did {random.choice(topics)} teach you about {random.choice(topics)}?"
+            for i in range(n)
+        ])
+    return "Thanks for asking. " + " ".join(["In my last role I focused on delivering reliable systems."] * 4)
+
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self._body() or b"{}")
+        if self._fault(server.model_faults.get(request.get("model")), body_read=True):
+            return
+        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+        reply = _fake_reply(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(reply) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = request.get("model", "fake-model")
+        with server.lock:
+            server.stats["completions"] += 1
+            server.stats["prompt_tokens"] += usage["prompt_tokens"]
+        if not request.get("stream"):
+            body = json.dumps({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            }).encode("utf-8")
+            self._send(200, body)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, word in enumerate(reply.split(" ")):
+            chunk = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if server.token_delay:
+                self.wfile.flush()
+                time.sleep(server.token_delay)
+        if (request.get("stream_options") or {}).get("include_usage"):
+            final = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeOpenAIServer(_Server):
+    # Local stand-in for POST /v1/chat/completions (plain and streamed). Point the
+    # gateway at `url + "/v1"` via base_url. `model_faults` maps a model name to
+    # its own FaultProfile, e.g. to make the primary model of a route slow.
+    def __init__(self, faults=None, token_delay=0.0, model_faults=None):
+        super().__init__(_OpenAIHandler, faults)
+        self.token_delay = token_delay
+        self.model_faults = model_faults or {}
+        self.stats.update({"completions": 0, "prompt_tokens": 0})
@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from answer_cache import AnswerCache, cache_key, profile_fingerprint
+from blob_store import SQLiteBlobStore, externalize_cv, with_cv_text
+from bench.fake_servers import FakeGistServer, FakeOpenAIServer, FaultProfile
+from cv_ingest import CVIngestCache, file_digest
+from cv_parse import autofill_cv
+from llm import LLMGateway
+from llm_scheduler import FairScheduler
+from model_router import ModelRouter
+from metrics import METRICS, set_user
+from question_pool import QuestionPool
+from retrieval import ProfileIndex
+from save_queue import WriteBehindQueue, diff_record
+from storage import create_backend
+from user_directory import new_user_record
+
+SAMPLE_CV = "\n".join(
+    [
+        "Sam Example",
+        "Senior Data Engineer, Leeds",
+        "sam@example.com | 07700 900123",
+        "Experience",
+        "Built Spark pipelines on AWS processing 2TB of events a day",
+        "Led the migration from Hadoop to Databricks for 40 analysts",
+        "Mentored four junior engineers through their first year",
+        "Certifications",
+        "AWS Certified Solutions Architect",
+        "Skills",
+        "Python, SQL, Spark, Airflow, Terraform",
+    ] * 6
+)
+QUESTIONS = [
+    "Tell me about a time you led a migration.",
+    "How do you mentor junior engineers?",
+    "What is your experience with AWS?",
+    "Describe a difficult stakeholder you worked with.",
+]
+
+
+def empty_record(username):
+    return new_user_record({"username": username, "password": "bench"})
+
+
+# ------------------ SIMULATED USER ------------------
+class Context:
+    def __init__(self, backend, queue, router, answer_cache, cv_cache, blobs):
+        self.backend = backend
+        self.router = router
+        self.blobs = blobs
+        self.queue = queue
+        self.answer_cache = answer_cache
+        self.cv_cache = cv_cache
+
+
+def step(name, fn):
+    try:
+        with METRICS.timer(name):
+            return fn()
+    except Exception:
+        return None
+
+
+def simulate_user(ctx, index, iterations):
+    username = f"bench{index}"
+    set_user(username)
+    record = empty_record(username)
+    saved = {}
+
+    def save():
+        ctx.queue.submit(username, diff_record(saved, record))
+        saved.clear()
+        saved.update(json.loads(json.dumps(record)))
+
+    step("signup", save)
+    step("login", lambda: ctx.backend.load_user(username))
+
+    for i in range(iterations):
+        def edit():
+            record["profile"]["goals"] = f"Goal revision {i}"
+            record["profile"]["skills"] = ["Python", "SQL", f"Skill {i}"]
+            save()
+        step("profile_edit", edit)
+
+    def upload():
+        cv = f"{SAMPLE_CV}\nBench user {index % 5}"
+        digest = file_digest(cv.encode("utf-8"))
+        text = ctx.cv_cache.extract(digest, lambda: cv)
+
+        def extract_chunk(chunk, i, total, fields):
+            prompt = (f"You are an expert CV parser. Extract {', '.join(fields)} as JSON. "
+                      f"Part {i + 1} of {total}:\n\n{chunk}")
+            return ctx.router.chat_json("cv_autofill", [{"role": "user", "content": prompt}])
+
+        filled = ctx.cv_cache.autofill(digest, lambda: autofill_cv(text, extract_chunk))
+        externalize_cv(record, ctx.blobs, text)
+        record["profile"].update({k: v for k, v in (filled or {}).items() if k in record["profile"]})
+        record["cvHash"] = digest
+        save()
+    step("cv_upload", upload)
+
+    def fetch(covered, count):
+        prompt = (
+            f"Ask me {count} insightful, unique questions. "
+            + (f"I've already answered {covered}. " if covered else "")
+            + f"Return only a JSON list of {count} questions."
+        )
+        return ctx.router.chat_json("gk_questions", [{"role": "user", "content": prompt}])
+
+    pool = QuestionPool(fetch, capacity=50, batch_size=3)
+    for _ in range(iterations):
+        question = step("qa_next_question", pool.next)
+        if question:
+            record["advanced"].append({"q": question, "a": "A thoughtful answer about my work."})
+            step("qa_submit", save)
+    pool.stop()
+
+    index_ = ProfileIndex()
+    for i in range(iterations):
+        question = QUESTIONS[i % len(QUESTIONS)]
+
+        def answer():
+            snippets = index_.update(with_cv_text(record, ctx.blobs)).search(question)
+            context = "\n\n".join(s["text"] for s in snippets)
+            messages = [
+                {"role": "system", "content": f"Profile context:\n{context}\n\nAnswer clearly."},
+                {"role": "user", "content": question},
+            ]
+            key = cache_key("interview_answer", ctx.router.route("interview_answer").model, question,
+                            profile_fingerprint(record))
+            return ctx.answer_cache.get_or_compute(key, lambda: ctx.router.chat("interview_answer", messages))
+        step("answer", answer)
+
+        def stream():
+            started = time.perf_counter()
+            first = None
+            for _ in ctx.router.stream("interview_answer_stream", [{"role": "user", "content": question}]):
+                if first is None:
+                    first = time.perf_counter() - started
+                    METRICS.observe("answer_stream_ttft", first)
+        step("answer_stream", stream)
+
+
+# ------------------ REPORT ------------------
+def format_report(snapshot, servers):
+    lines = [f"{'operation':<32}{'calls':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for name, op in sorted(snapshot["operations"].items()):
+        cells = [f"{op[q] * 1000:.1f}" if op[q] is not None else "-" for q in ("p50", "p95", "p99")]
+        lines.append(f"{name:<32}{op['count']:>8}{op['errors']:>8}{cells[0]:>10}{cells[1]:>10}{cells[2]:>10}")
+    if snapshot["counters"]:
+        lines.append(f"counters: {json.dumps(snapshot['counters'], sort_keys=True)}")
+    for label, stats in servers.items():
+        lines.append(f"{label}: {json.dumps(stats)}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against local Gist and OpenAI stand-ins.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--backend", choices=["gist", "sqlite"], default="gist")
+    parser.add_argument("--gist-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--slow-model", help="add --slow-model-latency seconds to every call to this model")
+    parser.add_argument("--slow-model-latency", type=float, default=5.0)
+    parser.add_argument("--debounce", type=float, default=0.5)
+    parser.add_argument("--processes", type=int, default=1,
+                        help="simulate this many app processes, each with its own backend cache and write queue")
+    parser.add_argument("--llm-tpm", type=int, default=90000, help="scheduler tokens-per-minute budget")
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--llm-user-tpm", type=int, default=20000)
+    parser.add_argument("--json", help="write the full metrics snapshot to this path")
+    args = parser.parse_args(argv)
+
+    METRICS.reservoir = 1_000_000
+    METRICS.enabled = True
+    METRICS.reset()
+    gist = FakeGistServer(faults=FaultProfile(args.gist_latency, args.jitter, args.failure_rate, (500, 502))).start()
+    openai_server = FakeOpenAIServer(
+        faults=FaultProfile(args.openai_latency, args.jitter, args.failure_rate, (429, 500)),
+        token_delay=args.token_delay,
+        model_faults={args.slow_model: FaultProfile(args.slow_model_latency)} if args.slow_model else None
+    ).start()
+    tmpdir = tempfile.mkdtemp(prefix="coach-bench-")
+    try:
+        scheduler = FairScheduler(tokens_per_minute=args.llm_tpm, max_concurrent=args.llm_concurrency,
+                                  user_tokens_per_minute=args.llm_user_tpm)
+        llm = LLMGateway(api_key="bench", base_url=f"{openai_server.url}/v1", backoff=0.05, max_backoff=0.5,
+                         scheduler=scheduler)
+        router = ModelRouter(llm)
+        contexts = []
+        for _ in range(max(1, args.processes)):
+            if args.backend == "gist":
+                backend = create_backend("gist", token="bench", gist_id="bench", api_url=gist.url, cache_ttl=1)
+            else:
+                backend = create_backend("sqlite", path=os.path.join(tmpdir, "profiles.db"))
+            contexts.append(Context(
+                backend=backend,
+                queue=WriteBehindQueue(backend, debounce=args.debounce, retry_delay=0.5),
+                router=router,
+                answer_cache=AnswerCache(),
+                cv_cache=CVIngestCache(),
+                blobs=SQLiteBlobStore(os.path.join(tmpdir, "blobs.db")),
+            ))
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=simulate_user, args=(contexts[i % len(contexts)], i, args.iterations))
+            for i in range(args.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with METRICS.timer("final_flush"):
+            for ctx in contexts:
+                ctx.queue.close(timeout=60)
+        elapsed = time.perf_counter() - started
+        contexts[0].backend.revalidate(force=True)
+        stored = contexts[0].backend.load_all() or {}
+        missing = [f"bench{i}" for i in range(args.users) if f"bench{i}" not in stored]
+        snapshot = METRICS.snapshot()
+        print(format_report(snapshot, {"gist": gist.stats, "openai": openai_server.stats}))
+        for row in router.report():
+            print(f"route {row['task']:<26}{row['model']:<16}{row['calls']:>5} calls {row['fallbacks']:>4} fallbacks "
+                  f"{row['avg s']:>6.2f}s avg  ${row['cost $']:.4f}")
+        print(f"{args.users} users x {args.iterations} iterations in {elapsed:.2f}s; "
+              f"write-behind: {sum(c.queue.submits for c in contexts)} submits -> "
+              f"{sum(c.queue.writes for c in contexts)} writes "
+              f"({sum(c.queue.conflicts for c in contexts)} conflicts, {len(missing)} users missing from the store); "
+              f"llm: {json.dumps(llm.stats)}; scheduler: {json.dumps(scheduler.status())}")
+        if args.json:
+            with open(args.json, "w") as fh:
+                json.dump({"elapsed": elapsed, "args": vars(args), "metrics": snapshot,
+                           "servers": {"gist": gist.stats, "openai": openai_server.stats}}, fh, indent=2)
+    finally:
+        gist.stop()
+        openai_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from metrics import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so the first run pays for every import, exactly
+# like a newly started Streamlit worker.
+_CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+from bench.fake_servers import FakeOpenAIServer
+from storage import SQLiteBackend
+from user_directory import new_user_record
+
+server = FakeOpenAIServer().start()
+record = new_user_record({{"username": "bench", "password": "bench"}})
+record["profile"]["name"] = "Bench"
+SQLiteBackend({db!r}).save_users({{"bench": record}})
+at = AppTest.from_file({main!r}, default_timeout=60)
+for key, value in {{"PROFILE_BACKEND": "sqlite", "PROFILE_DB_PATH": {db!r}, "OPENAI_API_KEY": "bench",
+                   "OPENAI_BASE_URL": server.url + "/v1"}}.items():
+    at.secrets[key] = value
+setup = time.perf_counter() - started
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+cold = timed(at.run)
+at.text_input[0].input("bench")
+at.text_input[1].input("bench")
+at.button[0].click()
+login = timed(at.run)
+reruns = [timed(at.run) for _ in range({reruns})]
+server.stop()
+print(json.dumps({{"setup": setup, "cold": cold, "login": login, "reruns": reruns,
+                  "exception": [str(e.value) for e in at.exception]}}))
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start and rerun time of the Streamlit app.")
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--cold-budget", type=float, default=3.0)
+    parser.add_argument("--rerun-budget", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix="coach-startup-")
+    code = _CHILD.format(root=ROOT, db=os.path.join(tmpdir, "profiles.db"),
+                         main=os.path.join(ROOT, "main.py"), reruns=args.reruns)
+    output = subprocess.run([sys.executable, "-c", code], cwd=tmpdir, capture_output=True, text=True, check=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    if result["exception"]:
+        print("app raised:", result["exception"])
+        return 1
+
+    rerun_p95 = percentile(result["reruns"], 0.95)
+    print(f"harness setup   {result['setup'] * 1000:8.1f} ms")
+    print(f"cold first run  {result['cold'] * 1000:8.1f} ms  (budget {args.cold_budget * 1000:.0f} ms)")
+    print(f"login run       {result['login'] * 1000:8.1f} ms")
+    print(f"rerun p50       {percentile(result['reruns'], 0.5) * 1000:8.1f} ms")
+    print(f"rerun p95       {rerun_p95 * 1000:8.1f} ms  (budget {args.rerun_budget * 1000:.0f} ms)")
+    over = result["cold"] > args.cold_budget or rerun_p95 > args.rerun_budget
+    if over:
+        print("over budget")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import base64
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+
+from metrics import METRICS
+
+REF_PREFIX = "sha256:"
+
+
+def blob_ref(text):
+    return REF_PREFIX + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _compress(text):
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _decompress(data):
+    return zlib.decompress(data).decode("utf-8")
+
+
+class _BlobCache:
+    # Blobs are immutable, so decoded copies can be kept without expiry.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ref):
+        with self._lock:
+            text = self._entries.get(ref)
+            if text is not None:
+                self._entries.move_to_end(ref)
+            return text
+
+    def put(self, ref, text):
+        with self._lock:
+            self._entries[ref] = text
+            self._entries.move_to_end(ref)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# ------------------ SQLITE BLOBS ------------------
+class SQLiteBlobStore:
+    # Content-addressed, zlib-compressed blobs in their own table; identical
+    # text is stored once however many profiles point at it.
+    def __init__(self, path="profiles.db", cache_entries=64):
+        self.path = path
+        self.stats = {"puts": 0, "deduplicated": 0, "loads": 0, "cache_hits": 0}
+        self._cache = _BlobCache(cache_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (ref TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL)"
+            )
+
+    def put(self, text):
+        ref = blob_ref(text)
+        data = _compress(text)
+        with METRICS.timer("blob_put", bytes_out=len(data)), self._lock, self._conn:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (ref, data, size) VALUES (?, ?, ?)", (ref, data, len(text))
+            ).rowcount
+        self.stats["puts"] += 1
+        if not inserted:
+            self.stats["deduplicated"] += 1
+        self._cache.put(ref, text)
+        return ref
+
+    def get(self, ref):
+        text = self._cache.get(ref)
+        if text is not None:
+            self.stats["cache_hits"] += 1
+            return text
+        with METRICS.timer("blob_get") as timer, self._lock:
+            row = self._conn.execute("SELECT data FROM blobs WHERE ref = ?", (ref,)).fetchone()
+            timer.add(bytes_in=len(row[0]) if row else 0)
+        if row is None:
+            return None
+        text = _decompress(row[0])
+        self.stats["loads"] += 1
+        self._cache.put(ref, text)
+        return text
+
+
+# ------------------ GIST BLOBS ------------------
+class GistBlobStore:
+    # Blobs live as separate files in their own Gist (not the profiles Gist), so
+    # writing one only PATCHes that file. The Gist API can only return the whole
+    # Gist (every blob's content, with the file list truncated on large Gists), so
+    # a read fetches just the one file from its raw URL; blobs are immutable,
+    # which makes the CDN caching of raw URLs harmless. Decoded text is cached
+    # per process.
+    def __init__(self, token, gist_id, timeout=10, api_url="https://api.github.com",
+                 raw_url="https://gist.github.com", cache_entries=64):
+        self.url = f"{api_url.rstrip('/')}/gists/{gist_id}"
+        self.raw_url = f"{raw_url.rstrip('/')}/{gist_id}/raw"
+        self.timeout = timeout
+        self.headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+        self.stats = {"puts": 0, "deduplicated": 0, "loads": 0, "cache_hits": 0}
+        self._cache = _BlobCache(cache_entries)
+        self._stored = set()
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _http(self):
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update(self.headers)
+        return self._session
+
+    @staticmethod
+    def _filename(ref):
+        return ref[len(REF_PREFIX):] + ".z64"
+
+    def put(self, text):
+        # PATCHing a file that already holds the same content is a no-op, so only
+        # blobs this process has already stored or read are skipped.
+        ref = blob_ref(text)
+        self.stats["puts"] += 1
+        with self._lock:
+            stored = ref in self._stored
+        if stored:
+            self.stats["deduplicated"] += 1
+        else:
+            content = base64.b64encode(_compress(text)).decode("ascii")
+            data = json.dumps({"files": {self._filename(ref): {"content": content}}})
+            with METRICS.timer("blob_put", bytes_out=len(data)):
+                # The response echoes the whole Gist; it is not needed, so it isn't read.
+                with self._http().patch(self.url, data=data, timeout=self.timeout, stream=True) as res:
+                    res.raise_for_status()
+            with self._lock:
+                self._stored.add(ref)
+        self._cache.put(ref, text)
+        return ref
+
+    def get(self, ref):
+        text = self._cache.get(ref)
+        if text is not None:
+            self.stats["cache_hits"] += 1
+            return text
+        with METRICS.timer("blob_get") as timer:
+            res = self._http().get(f"{self.raw_url}/{self._filename(ref)}", timeout=self.timeout)
+            timer.add(bytes_in=len(res.content))
+        if res.status_code == 404:
+            return None
+        res.raise_for_status()
+        text = _decompress(base64.b64decode(res.text))
+        self.stats["loads"] += 1
+        with self._lock:
+            self._stored.add(ref)
+        self._cache.put(ref, text)
+        return text
+
+
+BLOB_STORES = {
+    "gist": GistBlobStore,
+    "sqlite": SQLiteBlobStore,
+}
+
+
+def create_blob_store(name, **options):
+    if name not in BLOB_STORES:
+        raise ValueError(f"Unknown blob store: {name}")
+    return BLOB_STORES[name](**options)
+
+
+# ------------------ PROFILE CV TEXT ------------------
+def externalize_cv(record, store, text=None):
+    # Moves the CV text (the given `text`, or whatever is still stored inline)
+    # into the blob store and leaves only `cvRef` on the record. Without a store
+    # the text stays inline. Returns True if the record changed.
+    profile = record.setdefault("profile", {})
+    if text is None:
+        if "cvText" not in profile:
+            return False
+        text = profile["cvText"]
+    if store is None:
+        changed = profile.get("cvText") != text
+        profile["cvText"] = text
+        return changed
+    ref = store.put(text) if text else None
+    changed = "cvText" in profile or record.get("cvRef") != ref
+    profile.pop("cvText", None)
+    if ref:
+        record["cvRef"] = ref
+    else:
+        record.pop("cvRef", None)
+    return changed
+
+
+def cv_text(record, store):
+    text = record.get("profile", {}).get("cvText")
+    if text or not record.get("cvRef") or store is None:
+        return text or ""
+    return store.get(record["cvRef"]) or ""
+
+
+def with_cv_text(record, store):
+    # Shallow copy with the CV text filled in, for the features that read it.
+    if not record.get("cvRef"):
+        return record
+    bundle = dict(record)
+    bundle["profile"] = dict(record.get("profile", {}))
+    bundle["profile"]["cvText"] = cv_text(record, store)
+    return bundle
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from blob_store import externalize_cv
+from cv_ingest import file_digest
+from engine import Engine, apply_cv_fields, find_email
+from llm import LLMError
+from metrics import METRICS, percentile, set_user
+from storage import PENDING_KEY, REV_KEY, ConflictError, rev_of
+from user_directory import new_user_record
+
+CV_SUFFIXES = (".pdf", ".docx")
+# Top-level store keys that aren't user records.
+RESERVED_USERNAMES = (PENDING_KEY, REV_KEY)
+
+
+def load_config(path, overrides=()):
+    # Same keys as .streamlit/secrets.toml; `KEY=VALUE` overrides win (values are
+    # read as JSON when they parse, so numbers stay numbers).
+    config = {}
+    if path and os.path.exists(path):
+        try:
+            import tomllib
+
+            with open(path, "rb") as fh:
+                config = tomllib.load(fh)
+        except ImportError:
+            import toml
+
+            config = toml.load(path)
+    for item in overrides:
+        key, _, value = item.partition("=")
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def find_cvs(directory, recursive=False):
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(CV_SUFFIXES))
+        if not recursive:
+            break
+    return sorted(paths)
+
+
+def username_for(path):
+    stem = os.path.splitext(os.path.basename(path))[0].lower()
+    return re.sub(r"[^a-z0-9._-]+", "-", stem).strip("-.") or "user"
+
+
+def check_usernames(paths):
+    # Files whose name maps to a reserved key, or to the same username as another
+    # file, are reported instead of being parsed and merged into one record.
+    by_user = {}
+    for path in paths:
+        by_user.setdefault(username_for(path), []).append(path)
+    kept, failures = [], []
+    for username, group in by_user.items():
+        if username in RESERVED_USERNAMES:
+            failures.extend((path, f"'{username}' is a reserved name; rename the file") for path in group)
+        elif len(group) > 1:
+            failures.extend(
+                (path, f"same username '{username}' as {', '.join(p for p in group if p != path)}; rename one of the files")
+                for path in group
+            )
+        else:
+            kept.extend(group)
+    return sorted(kept), failures
+
+
+# ------------------ RESUME JOURNAL ------------------
+class Journal:
+    # Append-only JSON lines next to the CVs: a "parsed" entry per CV (its text
+    # and autofill result) and a "saved" entry per store write. A rerun skips
+    # saved CVs and reuses parsed ones, so no CV is extracted or sent to the LLM
+    # twice. A torn last line from a crash is ignored.
+    def __init__(self, path):
+        self.path = path
+        self.parsed = {}
+        self.saved = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("event") == "parsed":
+                        self.parsed[entry["digest"]] = entry
+                    elif entry.get("event") == "saved":
+                        self.saved.update(entry["digests"])
+        self._fh = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._fh.write(json.dumps(entry) + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self):
+        self._fh.close()
+
+
+# ------------------ PIPELINE ------------------
+def _read(engine, path, journal):
+    with open(path, "rb") as fh:
+        data = fh.read()
+    digest = file_digest(data)
+    if digest in journal.saved:
+        return {"path": path, "digest": digest, "status": "skipped"}
+    if digest in journal.parsed:
+        return dict(journal.parsed[digest], path=path, status="resumed")
+    started = time.perf_counter()
+    result = engine.extract_cv_text(data, os.path.basename(path))
+    if not result.text:
+        raise ValueError(f"no text could be extracted ({result.reason or 'empty document'})")
+    return {
+        "path": path, "digest": digest, "username": username_for(path), "text": result.text,
+        "pages": result.report()["pages_done"], "bytes": len(data), "status": "extracted",
+        "extract_seconds": time.perf_counter() - started,
+    }
+
+
+def _autofill(engine, entry, journal):
+    # Calls are attributed to the profile being filled, so the scheduler's
+    # per-user quotas and fair queuing apply per CV.
+    set_user(entry["username"])
+    started = time.perf_counter()
+    entry["filled"] = engine.autofill_profile(entry["text"])
+    entry["autofill_seconds"] = time.perf_counter() - started
+    journal.record({
+        "event": "parsed", "digest": entry["digest"], "username": entry["username"], "text": entry["text"],
+        "filled": entry["filled"], "pages": entry["pages"], "bytes": entry["bytes"],
+    })
+    entry["status"] = "parsed"
+    return entry
+
+
+def parse_all(engine, paths, journal, parse_workers=4, llm_concurrency=4, progress=None):
+    # Files are read and extracted `parse_workers` at a time (PDF pages fan out to
+    # the engine's process pool); each extracted CV goes straight to the autofill
+    # stage, which runs at most `llm_concurrency` CVs at once.
+    entries, failures = [], []
+    with ThreadPoolExecutor(max_workers=parse_workers) as readers, \
+            ThreadPoolExecutor(max_workers=llm_concurrency) as fillers:
+        reads = {readers.submit(_read, engine, path, journal): path for path in paths}
+        fills = {}
+        for future in as_completed(reads):
+            try:
+                entry = future.result()
+            except Exception as e:
+                failures.append((reads[future], f"extract: {e}"))
+                continue
+            if entry["status"] == "extracted":
+                fills[fillers.submit(_autofill, engine, entry, journal)] = entry["path"]
+            else:
+                entries.append(entry)
+        for future in as_completed(fills):
+            try:
+                entries.append(future.result())
+            except LLMError as e:
+                failures.append((fills[future], f"autofill: {e}"))
+            if progress:
+                progress(len(entries), len(paths))
+    return entries, failures
+
+
+def build_changes(entries, current, blobs, passwords):
+    # New usernames get a new account with their password from `passwords`;
+    # existing ones keep their settings and only have their profile refilled
+    # from the CV.
+    changes, created = {}, {}
+    for entry in entries:
+        username = entry["username"]
+        record = current.get(username)
+        if record is None:
+            password = passwords[username]
+            record = new_user_record({
+                "username": username, "password": password, "email": find_email(entry["text"]),
+            })
+            created[username] = password
+        else:
+            record = json.loads(json.dumps(record))
+        record["profile"]["name"] = record["profile"].get("name") or entry["filled"].get("name", "")
+        apply_cv_fields(record["profile"], entry["filled"])
+        externalize_cv(record, blobs, entry["text"])
+        record["cvHash"] = entry["digest"]
+        changes[username] = record
+    return changes, created
+
+
+def write_profiles(engine, entries, before_write=None, attempts=3):
+    # One batched save_users call for the whole run, as a compare-and-swap on the
+    # revisions it read; on a conflict it re-reads and rebuilds. Passwords are
+    # chosen once, so a retry keeps them; `before_write(created)` sees the new
+    # accounts before they are stored.
+    backend = engine.backend
+    passwords = {entry["username"]: secrets.token_urlsafe(9) for entry in entries}
+    for attempt in range(attempts):
+        backend.revalidate(force=True)
+        # Only this batch's users are read (one row each on SQLite, one record
+        # copied out of the cached document on a Gist), never the whole store.
+        current = {}
+        for username in {entry["username"] for entry in entries}:
+            record = backend.load_user(username)
+            if isinstance(record, dict):
+                current[username] = record
+        changes, created = build_changes(entries, current, engine.blobs, passwords)
+        if before_write:
+            before_write(created)
+        try:
+            with METRICS.timer("ingest_store_write"):
+                backend.save_users(changes, expected={u: rev_of(current.get(u)) for u in changes})
+            return changes, created
+        except ConflictError:
+            METRICS.incr("ingest_write_conflicts")
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.2 * (attempt + 1))
+
+
+# ------------------ REPORT ------------------
+def print_report(entries, failures, skipped, elapsed, engine):
+    extracted = [e for e in entries if e["status"] == "parsed"]
+    pages = sum(e.get("pages", 0) for e in extracted)
+    mb = sum(e.get("bytes", 0) for e in extracted) / 1e6
+    print(f"{len(entries)} CVs ingested, {len(skipped)} already saved, {len(failures)} failed in {elapsed:.1f}s")
+    if extracted:
+        print(f"throughput      {len(extracted) / elapsed:8.2f} CVs/s  {pages / elapsed:8.2f} pages/s  {mb / elapsed:8.2f} MB/s")
+        for label, key in (("extract", "extract_seconds"), ("autofill", "autofill_seconds")):
+            samples = [e[key] for e in extracted if key in e]
+            print(f"{label:<15} p50 {percentile(samples, 0.5):7.2f}s  p95 {percentile(samples, 0.95):7.2f}s")
+    counters = METRICS.snapshot()["counters"]
+    print(f"fields          {counters.get('cv_local_fields', 0)} filled locally, "
+          f"{counters.get('cv_llm_fields', 0)} sent to the LLM, {counters.get('cv_local_only', 0)} CVs without an LLM call")
+    for row in engine.router.report():
+        print(f"route {row['task']:<20}{row['model']:<16}{row['calls']:>5} calls {row['failures']:>4} failures "
+              f"{row['avg s']:>6.2f}s avg  {row['tokens']:>8} tokens  ${row['cost $']:.4f}")
+    status = engine.scheduler.status()
+    print(f"scheduler       {status['admitted']} admitted, {status['waited']} waited, peak depth {status['peak_depth']}, "
+          f"{status['rejected']} rejected, {status['timeouts']} timed out")
+    for path, error in failures:
+        print(f"failed          {path}: {error}")
+
+
+class CredentialsFile:
+    # New accounts' passwords are appended and synced to disk before the store
+    # write that creates them, so an account never exists with a lost password.
+    def __init__(self, path):
+        self.path = path
+        self.written = set()
+
+    def write(self, created):
+        rows = sorted((u, p) for u, p in created.items() if u not in self.written)
+        if not rows:
+            return
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as fh:
+            writer = csv.writer(fh)
+            if new_file:
+                writer.writerow(["username", "password"])
+            writer.writerows(rows)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.written.update(u for u, _ in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create or update profiles from a directory of PDF/DOCX CVs.")
+    parser.add_argument("directory")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"),
+                        help="secrets.toml with the app's settings (default: .streamlit/secrets.toml)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a setting")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--parse-workers", type=int, default=4, help="CVs extracted at once")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="CVs autofilled at once")
+    parser.add_argument("--journal", help="resume journal (default: <directory>/.ingest-journal.jsonl)")
+    parser.add_argument("--credentials", default="new_accounts.csv",
+                        help="where to write usernames and passwords of accounts this run creates")
+    args = parser.parse_args(argv)
+
+    paths = find_cvs(args.directory, recursive=args.recursive)
+    if not paths:
+        print(f"No PDF or DOCX files in {args.directory}")
+        return 1
+    paths, failures = check_usernames(paths)
+    engine = Engine(load_config(args.secrets, args.set))
+    journal = Journal(args.journal or os.path.join(args.directory, ".ingest-journal.jsonl"))
+    started = time.perf_counter()
+    try:
+        entries, parse_failures = parse_all(
+            engine, paths, journal, parse_workers=args.parse_workers, llm_concurrency=args.llm_concurrency,
+            progress=lambda done, total: print(f"\r{done}/{total} parsed", end="", file=sys.stderr, flush=True)
+        )
+        failures += parse_failures
+        print(file=sys.stderr)
+        skipped = [e for e in entries if e["status"] == "skipped"]
+        pending = [e for e in entries if e["status"] != "skipped"]
+        if pending:
+            credentials = CredentialsFile(args.credentials)
+            changes, created = write_profiles(engine, pending, before_write=credentials.write)
+            journal.record({"event": "saved", "digests": [e["digest"] for e in pending]})
+            if created:
+                print(f"{len(created)} new account(s); passwords written to {args.credentials}")
+            print(f"1 store write for {len(changes)} profile(s)")
+        print_report(pending, failures, skipped, time.perf_counter() - started, engine)
+    finally:
+        journal.close()
+        engine.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def create_pool(workers=None):
+    # "spawn" keeps workers independent of the threads running in the parent.
+    workers = workers or min(4, os.cpu_count() or 1)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class ExtractionResult:
+    def __init__(self):
+        self.pages = {}
+        self.page_timings = []
+        self.pages_total = 0
+        self.text_bytes = 0
+        self.partial = False
+        self.reason = ""
+        self.elapsed = 0.0
+
+    @property
+    def text(self):
+        return "\n".join(self.pages[i] for i in sorted(self.pages) if self.pages[i])
+
+    def report(self):
+        slowest = max(self.page_timings, key=lambda item: item[1], default=None)
+        return {
+            "pages_total": self.pages_total,
+            "pages_done": len(self.pages),
+            "partial": self.partial,
+            "reason": self.reason,
+            "elapsed": round(self.elapsed, 3),
+            "slowest_page": slowest[0] + 1 if slowest else None,
+            "slowest_page_seconds": round(slowest[1], 3) if slowest else None,
+            "page_timings": [(page + 1, round(seconds, 3)) for page, seconds in self.page_timings],
+        }
+
+
+# ------------------ PDF ------------------
+def _extract_pdf_pages(path, start, stop):
+    # Runs in a worker process; each page's text is extracted exactly once.
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(path)
+    out = []
+    for i in range(start, stop):
+        started = time.perf_counter()
+        try:
+            text = reader.pages[i].extract_text() or ""
+        except Exception:
+            text = ""
+        out.append((i, text, time.perf_counter() - started))
+    return out
+
+
+def _pdf_page_count(path):
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def extract_pdf(data, pool=None, max_pages=50, time_budget=20.0, max_text_bytes=200_000, pages_per_task=2):
+    result = ExtractionResult()
+    started = time.perf_counter()
+    deadline = started + time_budget
+    # Workers read the PDF from a temp file instead of receiving the bytes per task.
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        result.pages_total = _pdf_page_count(path)
+        last_page = min(result.pages_total, max_pages)
+        if last_page < result.pages_total:
+            result.partial, result.reason = True, f"page limit ({max_pages})"
+        ranges = [(i, min(i + pages_per_task, last_page)) for i in range(0, last_page, pages_per_task)]
+
+        if pool is None:
+            for start, stop in ranges:
+                if time.perf_counter() > deadline:
+                    result.partial, result.reason = True, f"time budget ({time_budget}s)"
+                    break
+                if not _collect(result, _extract_pdf_pages(path, start, stop), max_text_bytes):
+                    break
+        else:
+            # Keep a bounded window of tasks in flight so memory stays flat for long files.
+            window = max(1, getattr(pool, "_max_workers", 2) * 2)
+            pending = iter(ranges)
+            in_flight = set()
+            stopped = False
+            while True:
+                while not stopped and len(in_flight) < window:
+                    task = next(pending, None)
+                    if task is None:
+                        break
+                    in_flight.add(pool.submit(_extract_pdf_pages, path, *task))
+                if not in_flight:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    result.partial, result.reason = True, f"time budget ({time_budget}s)"
+                    break
+                done, in_flight = wait(in_flight, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if not stopped and not _collect(result, future.result(), max_text_bytes):
+                        stopped = True
+                if stopped:
+                    break
+            for future in in_flight:
+                future.cancel()
+    finally:
+        # A worker still busy on a slow page keeps its own handle; on POSIX the
+        # unlink is safe, elsewhere the file is left for the OS temp cleaner.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _collect(result, pages, max_text_bytes):
+    for index, text, seconds in pages:
+        result.pages[index] = text
+        result.page_timings.append((index, seconds))
+        result.text_bytes += len(text.encode("utf-8"))
+    result.page_timings.sort()
+    if result.text_bytes > max_text_bytes:
+        result.partial, result.reason = True, f"text limit ({max_text_bytes} bytes)"
+        return False
+    return True
+
+
+# ------------------ ENTRY POINT ------------------
+def extract_cv(data, filename, pool=None, max_file_bytes=10_000_000, **budgets):
+    result = ExtractionResult()
+    if len(data) > max_file_bytes:
+        result.partial, result.reason = True, f"file larger than {max_file_bytes} bytes"
+        return result
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return extract_pdf(data, pool=pool, **budgets)
+    if name.endswith(".docx"):
+        import docx2txt
+
+        started = time.perf_counter()
+        result.pages[0] = docx2txt.process(io.BytesIO(data)) or ""
+        result.pages_total = 1
+        result.page_timings.append((0, time.perf_counter() - started))
+        result.elapsed = result.page_timings[0][1]
+    return result
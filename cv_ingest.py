@@ -0,0 +1,65 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def file_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# ------------------ INGESTION CACHE ------------------
+class CVIngestCache:
+    # Extraction text and autofill results keyed by the file's content hash, so a
+    # Streamlit rerun (or another user uploading the same file) never re-parses
+    # the document or calls the LLM again. `stats` counts real calls per digest.
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.stats = {"extract_calls": 0, "autofill_calls": 0, "extract_hits": 0, "autofill_hits": 0}
+        self._calls = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._digest_locks = {}
+
+    def _entry(self, digest):
+        with self._lock:
+            entry = self._entries.setdefault(digest, {})
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._digest_locks.pop(evicted, None)
+                self._calls.pop(evicted, None)
+            return entry, self._digest_locks.setdefault(digest, threading.Lock())
+
+    def _count(self, digest, kind):
+        calls = self._calls.setdefault(digest, {"extract": 0, "autofill": 0})
+        calls[kind] += 1
+        self.stats[f"{kind}_calls"] += 1
+
+    def extract(self, digest, extract):
+        entry, lock = self._entry(digest)
+        with lock:
+            if "text" in entry:
+                self.stats["extract_hits"] += 1
+                return entry["text"]
+            self._count(digest, "extract")
+            entry["text"] = extract()
+            return entry["text"]
+
+    def autofill(self, digest, autofill):
+        entry, lock = self._entry(digest)
+        with lock:
+            if "filled" in entry:
+                self.stats["autofill_hits"] += 1
+                return entry["filled"]
+            self._count(digest, "autofill")
+            filled = autofill()
+            # Failed or empty results are not cached so a later upload can retry.
+            if filled:
+                entry["filled"] = filled
+            return filled
+
+    def repeat_calls(self):
+        return sum(
+            max(0, calls["extract"] - 1) + max(0, calls["autofill"] - 1)
+            for calls in self._calls.values()
+        )
@@ -0,0 +1,345 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import EMAIL_PATTERN, LIST_FIELDS, SCALAR_FIELDS
+from metrics import METRICS
+
+# Canonical section -> header phrases seen on CVs.
+SECTION_HEADERS = {
+    "summary": ("summary", "profile", "personal profile", "professional summary", "about me", "objective",
+                "career objective", "personal statement", "career goals", "goals"),
+    "experience": ("experience", "work experience", "professional experience", "employment", "employment history",
+                   "work history", "career history", "relevant experience"),
+    "education": ("education", "qualifications", "academic background", "education and qualifications"),
+    "skills": ("skills", "technical skills", "key skills", "core skills", "core competencies", "competencies",
+               "technologies", "tools", "skills and abilities"),
+    "softSkills": ("soft skills", "personal skills", "interpersonal skills", "attributes"),
+    "certifications": ("certifications", "certificates", "licences", "licenses", "accreditations",
+                       "certifications and training"),
+    "learning": ("training", "courses", "professional development", "currently learning", "learning"),
+    "projects": ("projects", "key projects", "selected projects"),
+    "interests": ("interests", "hobbies", "hobbies and interests"),
+    "references": ("references",),
+}
+_HEADER_LOOKUP = {phrase: section for section, phrases in SECTION_HEADERS.items() for phrase in phrases}
+# Sections that can hold each profile field; the LLM only sees these when
+# asked for a few fields.
+FIELD_SECTIONS = {
+    "name": ("header",),
+    "title": ("header", "summary", "experience"),
+    "location": ("header",),
+    "goals": ("header", "summary"),
+    "skills": ("header", "summary", "skills", "experience", "projects"),
+    "softSkills": ("summary", "softSkills", "skills"),
+    "experience": ("experience", "projects"),
+    "certifications": ("certifications", "education", "learning"),
+    "learning": ("learning", "education", "certifications"),
+}
+_BULLETS = re.compile(r"[•●▪︎◦•▪]+")
+
+
+def clean_cv_text(cv_text):
+    # Drops bullet characters and blank lines but keeps line structure, which
+    # section detection relies on.
+    text = _BULLETS.sub("", str(cv_text or ""))
+    lines = [re.sub(r"[ \t]+", " ", line).strip(" -\t") for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def section_of(line):
+    # A header is a short line such as "WORK EXPERIENCE" or "Skills:".
+    key = re.sub(r"[^a-z& ]", "", line.lower().replace("&", "and")).strip()
+    if not key or len(key.split()) > 5:
+        return None
+    return _HEADER_LOOKUP.get(key)
+
+
+def split_sections(cv_text):
+    # [(section, header line, [body lines])]; text before the first header is
+    # the "header" section (name, contact details, headline).
+    sections = [("header", "", [])]
+    for line in clean_cv_text(cv_text).splitlines():
+        section = section_of(line)
+        if section:
+            sections.append((section, line, []))
+        else:
+            sections[-1][2].append(line)
+    return [s for s in sections if s[2] or s[0] != "header"]
+
+
+# ------------------ CHUNKING ------------------
+def chunk_sections(cv_text, max_chars=2500, sections=None):
+    # Packs whole sections into chunks of at most `max_chars`; a longer section is
+    # split on line boundaries and every piece repeats its header so the model
+    # still knows what it is reading. `sections` keeps only those sections (all of
+    # them if none match).
+    parts = split_sections(cv_text)
+    if sections is not None:
+        parts = [part for part in parts if part[0] in sections] or parts
+    chunks, current = [], ""
+    for section, header, lines in parts:
+        title = header or section.title()
+        pieces, piece = [], ""
+        for line in lines:
+            if piece and len(piece) + len(line) + 1 > max_chars - len(title) - 16:
+                pieces.append(piece)
+                piece = ""
+            piece = f"{piece}\n{line}" if piece else line
+        if piece or not pieces:
+            pieces.append(piece)
+        for i, body in enumerate(pieces):
+            block = f"{title}{' (continued)' if i else ''}\n{body}".strip()
+            if current and len(current) + len(block) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{block}" if current else block
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# ------------------ MERGE ------------------
+def _norm(value):
+    return re.sub(r"\W+", " ", str(value).lower()).strip()
+
+
+def merge_profiles(results):
+    # Scalars: first non-empty value in document order. Lists: concatenated in
+    # order with case/punctuation-insensitive duplicates removed.
+    merged = {field: "" for field in SCALAR_FIELDS}
+    merged.update({field: [] for field in LIST_FIELDS})
+    seen = {field: set() for field in LIST_FIELDS}
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        for field in SCALAR_FIELDS:
+            value = result.get(field)
+            if not merged[field] and isinstance(value, str) and value.strip():
+                merged[field] = value.strip()
+        for field in LIST_FIELDS:
+            values = result.get(field) or []
+            if isinstance(values, str):
+                values = values.split(",")
+            for value in values:
+                text = str(value).strip()
+                key = _norm(text)
+                if key and key not in seen[field]:
+                    seen[field].add(key)
+                    merged[field].append(text)
+    return merged
+
+
+# ------------------ PIPELINE ------------------
+def parse_cv(cv_text, extract_chunk, max_chars=2500, max_chunks=12, max_workers=6, sections=None):
+    # Map: `extract_chunk(chunk, index, total)` returns a partial profile dict for
+    # one chunk; chunks run concurrently so latency follows the slowest chunk.
+    # Reduce: merge_profiles. A failed chunk is skipped; if every chunk fails the
+    # first error is raised.
+    chunks = chunk_sections(cv_text, max_chars=max_chars, sections=sections)[:max_chunks]
+    if not chunks:
+        return {}
+    with METRICS.timer("cv_parse", bytes_in=sum(len(c) for c in chunks)):
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            # Each worker runs in a copy of the caller's context so the calls are
+            # still attributed (and scheduled) to the calling user.
+            futures = [
+                pool.submit(contextvars.copy_context().run, extract_chunk, chunk, i, len(chunks))
+                for i, chunk in enumerate(chunks)
+            ]
+            results, errors = [], []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+    METRICS.incr("cv_parse_chunks", len(chunks))
+    if errors:
+        METRICS.incr("cv_parse_chunk_failures", len(errors))
+    if not results:
+        raise errors[0]
+    return merge_profiles(results)
+
+
+# ------------------ LOCAL EXTRACTION ------------------
+# Headers whose summary text can be used as the profile's goals as-is.
+GOAL_HEADERS = ("objective", "career objective", "career goals", "goals")
+# On a CV with recognisable sections, a field whose own section is missing is
+# taken as confidently empty rather than sent to the LLM to search for.
+OPTIONAL_SECTIONS = {"goals": "summary", "softSkills": "softSkills", "learning": "learning",
+                     "certifications": "certifications"}
+ABSENT_CONFIDENCE = 0.8
+
+_PHONE = re.compile(r"\+?\d[\d ()-]{7,}\d")
+_URL = re.compile(r"(https?://|www\.)\S+|\S*(linkedin|github)\.com\S*", re.I)
+_POSTCODE = re.compile(r"\b[A-Z]{1,2}\d[A-Z\d]? ?\d[A-Z]{2}\b")
+_LABELLED = re.compile(r"^(name|job title|title|role|location|address|based in)\s*[:\-]\s*(.+)$", re.I)
+_PERSON = re.compile(r"^[A-Z][A-Za-z'\-]+( [A-Z][A-Za-z'\-.]*){1,3}$")
+# Title lines that often open a CV and would otherwise pass for a name.
+_DOCUMENT_TITLES = ("curriculum vitae", "cv", "resume", "my cv", "my resume", "personal details",
+                    "contact details", "contact", "contact information")
+_CERTIFICATE = re.compile(
+    r"\b(certified|certificate|certification|accredited|CCNA|CCNP|CISSP|CISM|PMP|PRINCE2|ITIL|CKA|CKAD)\b", re.I
+)
+_TITLE_WORDS = (
+    "engineer", "developer", "programmer", "manager", "analyst", "consultant", "designer", "architect",
+    "scientist", "administrator", "specialist", "lead", "director", "officer", "coordinator", "technician",
+    "assistant", "executive", "accountant", "teacher", "nurse", "intern", "graduate", "tester", "head of",
+    "owner", "advisor", "adviser", "researcher",
+)
+_PLACES = (
+    "uk", "united kingdom", "england", "scotland", "wales", "northern ireland", "ireland", "usa",
+    "united states", "canada", "australia", "new zealand", "india", "germany", "france", "netherlands",
+    "spain", "remote", "london", "manchester", "birmingham", "leeds", "glasgow", "edinburgh", "bristol",
+    "liverpool", "cardiff", "belfast", "dublin", "new york",
+)
+
+
+def _has_word(text, words):
+    text = text.lower()
+    return any(re.search(rf"\b{re.escape(word)}\b", text) for word in words)
+
+
+def _header_parts(lines):
+    # Splits "Sam Example | Data Engineer | Leeds, UK | sam@x.com" into its parts
+    # and drops contact details.
+    for index, line in enumerate(lines):
+        for part in re.split(r"\s*(?:\||·|\t| – | — | - )\s*", line):
+            part = _PHONE.sub("", EMAIL_PATTERN.sub("", _URL.sub("", part))).strip(" ,;:")
+            if part:
+                yield index, part
+
+
+def _list_items(lines):
+    # Skills-style sections: comma/semicolon/pipe separated, with optional
+    # "Languages:" style labels in front.
+    items = []
+    for line in lines:
+        line = re.sub(r"^[A-Za-z /&]{2,30}:\s*", "", line)
+        items.extend(item.strip(" .") for item in re.split(r"\s*[,;|]\s*", line))
+    return [item for item in items if item and len(item) <= 60]
+
+
+def _is_document_title(part):
+    key = re.sub(r"[^a-z ]", "", part.lower().replace("é", "e")).strip()
+    return key in _DOCUMENT_TITLES or section_of(part) is not None
+
+
+def _has_contact(line):
+    return bool(EMAIL_PATTERN.search(line) or _PHONE.search(line) or _URL.search(line))
+
+
+def _header_fields(lines, found):
+    lines = lines[:8]
+    contact = [_has_contact(line) for line in lines]
+    first = None
+    for index, part in _header_parts(lines):
+        if _is_document_title(part):
+            continue
+        first = index if first is None else first
+        labelled = _LABELLED.match(part)
+        if labelled:
+            label, value = labelled.group(1).lower(), labelled.group(2).strip()
+            field = {"name": "name", "job title": "title", "title": "title", "role": "title"}.get(label, "location")
+            found(field, value, 0.95)
+            continue
+        head, _, tail = part.partition(", ")
+        if _has_word(part, _TITLE_WORDS) and len(part.split()) <= 8:
+            # "Senior Data Engineer, Leeds" -> title plus a possible location.
+            found("title", head if _has_word(head, _TITLE_WORDS) else part, 0.85 if not tail else 0.8)
+            if tail and (_has_word(tail, _PLACES) or _POSTCODE.search(tail)):
+                found("location", tail, 0.85)
+            elif tail and len(tail.split()) <= 3 and tail[:1].isupper():
+                found("location", tail, 0.6)
+        elif _has_word(part, _PLACES) or _POSTCODE.search(part):
+            found("location", part, 0.85)
+        elif _PERSON.match(part) and not _has_word(part, _PLACES):
+            # Only the opening line, in normal case and with contact details on it or
+            # just below (name, headline, contacts), is trusted as the name;
+            # anything else is left for the LLM to confirm.
+            near_contact = any(contact[max(index - 1, 0):index + 3])
+            trusted = index == first and not part.isupper() and near_contact
+            found("name", part, 0.9 if trusted else 0.7)
+
+
+def local_extract(cv_text):
+    # Deterministic, network-free first pass over the CV: header lines give the
+    # name, title and location; recognised sections give the list fields. Returns
+    # (profile, confidence) with a 0-1 confidence per field; 0 means not found,
+    # and an empty field with a high score is confidently empty.
+    profile = {field: "" for field in SCALAR_FIELDS}
+    profile.update({field: [] for field in LIST_FIELDS})
+    confidence = {field: 0.0 for field in SCALAR_FIELDS + LIST_FIELDS}
+
+    def found(field, value, score):
+        if value and score > confidence[field]:
+            profile[field] = value
+            confidence[field] = score
+
+    by_section, goals = {}, []
+    for section, header, lines in split_sections(cv_text):
+        by_section.setdefault(section, []).extend(lines)
+        if section == "summary" and re.sub(r"[^a-z ]", "", header.lower()).strip() in GOAL_HEADERS:
+            goals.extend(lines)
+
+    _header_fields(by_section.get("header", []), found)
+
+    for field in ("skills", "softSkills"):
+        items = _list_items(by_section.get(field, []))
+        found(field, list(dict.fromkeys(items)), 0.9 if len(items) > 1 else 0.6)
+    for field in ("certifications", "learning"):
+        found(field, list(dict.fromkeys(by_section.get(field, []))), 0.9)
+    found("experience", list(dict.fromkeys(by_section.get("experience", []))), 0.8)
+    if not profile["certifications"]:
+        # Certificates listed under education or training.
+        lines = [line for line in clean_cv_text(cv_text).splitlines() if _CERTIFICATE.search(line) and len(line) <= 120]
+        found("certifications", list(dict.fromkeys(lines)), 0.7)
+
+    found("goals", " ".join(goals), 0.85)
+    # A general summary is only a weak hint at goals; the LLM phrases them better.
+    found("goals", " ".join(by_section.get("summary", [])), 0.4)
+
+    if len(set(by_section) - {"header"}) >= 2:
+        for field, section in OPTIONAL_SECTIONS.items():
+            if section not in by_section and not profile[field]:
+                confidence[field] = max(confidence[field], ABSENT_CONFIDENCE)
+    return profile, confidence
+
+
+def low_confidence_fields(confidence, threshold):
+    return [field for field in SCALAR_FIELDS + LIST_FIELDS if confidence.get(field, 0) < threshold]
+
+
+def autofill_cv(cv_text, extract_chunk, threshold=0.75, on_local=None, **options):
+    # Local pass first; only the fields under `threshold` go to the LLM via
+    # parse_cv, with `extract_chunk(chunk, index, total, fields)` asked for just
+    # those fields over just the sections that can hold them.
+    # `on_local(profile, confidence, missing)` sees the local result before any
+    # LLM call. If the LLM fails, the local fields are still returned.
+    with METRICS.timer("cv_local_extract", bytes_in=len(cv_text or "")):
+        local, confidence = local_extract(cv_text)
+    missing = low_confidence_fields(confidence, threshold)
+    METRICS.incr("cv_local_fields", len(confidence) - len(missing))
+    if on_local:
+        on_local(local, confidence, missing)
+    if not missing:
+        METRICS.incr("cv_local_only")
+        return local
+    METRICS.incr("cv_llm_fields", len(missing))
+    try:
+        filled = parse_cv(
+            cv_text,
+            lambda chunk, i, total: extract_chunk(chunk, i, total, missing),
+            sections={section for field in missing for section in FIELD_SECTIONS[field]},
+            **options
+        )
+    except Exception:
+        if not any(local.values()):
+            raise
+        METRICS.incr("cv_llm_fallback_to_local")
+        return local
+    merged = dict(local)
+    for field in missing:
+        if filled.get(field):
+            merged[field] = filled[field]
+    return merged
@@ -0,0 +1,231 @@
+import re
+import threading
+
+from blob_store import create_blob_store
+from cv_extract import create_pool, extract_cv
+from llm import LLMError, LLMGateway
+from llm_scheduler import FairScheduler, fan_out
+from metrics import METRICS
+from model_router import ModelRouter
+from storage import create_backend
+
+# Everything the app does that doesn't need Streamlit. `config` is any mapping
+# with the app's secrets keys: st.secrets in the app, a parsed secrets.toml in
+# the CLI.
+
+PROFILE_STORE = "profiles.json"
+# The profile fields a CV fills, shared by the CV parser, the app and the CLI.
+SCALAR_FIELDS = ("name", "title", "location", "goals")
+LIST_FIELDS = ("skills", "softSkills", "experience", "certifications", "learning")
+
+CV_PARSE_PROMPT = (
+    "You are an expert CV parser. Extract the following structured profile information as a JSON object:\n\n"
+    "{\n"
+    "  \"name\": string,\n"
+    "  \"title\": string,\n"
+    "  \"location\": string,\n"
+    "  \"skills\": [string],\n"
+    "  \"softSkills\": [string],\n"
+    "  \"experience\": [string],\n"
+    "  \"certifications\": [string],\n"
+    "  \"learning\": [string],\n"
+    "  \"goals\": string\n"
+    "}\n\n"
+    "Only return valid JSON. Use bullet points from experience and training sections. "
+)
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+
+# ------------------ FACTORIES ------------------
+def create_profile_backend(config):
+    backend_name = config.get("PROFILE_BACKEND", "gist")
+    if backend_name == "sqlite":
+        return create_backend("sqlite", path=config.get("PROFILE_DB_PATH", "profiles.db"))
+    return create_backend(
+        "gist",
+        token=config["GITHUB_TOKEN"],
+        gist_id=config["GIST_ID"],
+        filename=PROFILE_STORE,
+        cache_ttl=float(config.get("GIST_CACHE_TTL_SECONDS", 30))
+    )
+
+
+def create_cv_blob_store(config):
+    # Large fields (the CV text) live here; profile records only keep a `cvRef`.
+    # Returns None when no blob store is configured, which keeps CV text inline.
+    store_name = config.get("BLOB_STORE", "sqlite" if config.get("PROFILE_BACKEND", "gist") == "sqlite" else "gist")
+    if store_name == "sqlite":
+        return create_blob_store("sqlite", path=config.get("BLOB_DB_PATH", config.get("PROFILE_DB_PATH", "profiles.db")))
+    if store_name == "gist" and config.get("BLOB_GIST_ID"):
+        return create_blob_store("gist", token=config["GITHUB_TOKEN"], gist_id=config["BLOB_GIST_ID"])
+    return None
+
+
+def create_scheduler(config):
+    return FairScheduler(
+        tokens_per_minute=int(config.get("LLM_TOKENS_PER_MINUTE", 90000)),
+        max_concurrent=int(config.get("LLM_MAX_CONCURRENT", 8)),
+        user_tokens_per_minute=int(config.get("LLM_USER_TOKENS_PER_MINUTE", 20000)),
+        user_concurrency=int(config.get("LLM_USER_CONCURRENCY", 2)),
+        user_max_queued=int(config.get("LLM_USER_MAX_QUEUED", 20)),
+        max_wait=float(config.get("LLM_MAX_QUEUE_SECONDS", 60))
+    )
+
+
+def create_gateway(config, scheduler=None):
+    return LLMGateway(
+        api_key=config["OPENAI_API_KEY"],
+        base_url=config.get("OPENAI_BASE_URL"),
+        timeout=float(config.get("OPENAI_TIMEOUT_SECONDS", 30)),
+        max_retries=int(config.get("OPENAI_MAX_RETRIES", 3)),
+        scheduler=scheduler
+    )
+
+
+def create_router(config, gateway):
+    # [MODEL_ROUTES.<task>] tables override the default routes.
+    routes = {task: dict(route) for task, route in config.get("MODEL_ROUTES", {}).items()}
+    prices = {model: tuple(price) for model, price in config.get("MODEL_PRICES", {}).items()}
+    return ModelRouter(gateway, routes=routes, prices=prices)
+
+
+def create_extract_pool(config):
+    return create_pool(int(config.get("CV_EXTRACT_WORKERS", 0)) or None)
+
+
+# ------------------ PROFILES ------------------
+def new_profile_record(name=""):
+    # The one profile skeleton; account records (user_directory.new_user_record)
+    # add their settings on top.
+    return {
+        "profile": {
+            "name": name,
+            "title": "",
+            "location": "",
+            "experience": [],
+            "skills": [],
+            "softSkills": [],
+            "learning": [],
+            "certifications": [],
+            "goals": "",
+            "cvText": ""
+        },
+        "advanced": []
+    }
+
+
+def apply_cv_fields(profile_data, filled):
+    for key in SCALAR_FIELDS:
+        profile_data[key] = filled.get(key, profile_data.get(key, ""))
+    for key in LIST_FIELDS:
+        if key == "experience":
+            continue
+        value = filled.get(key, "")
+        if isinstance(value, list):
+            profile_data[key] = [s.strip() for s in value]
+        elif isinstance(value, str):
+            profile_data[key] = [s.strip() for s in value.split(",")]
+        else:
+            profile_data[key] = []
+    profile_data["experience"] = filled.get("experience", [])
+
+
+def find_email(cv_text):
+    match = EMAIL_PATTERN.search(cv_text or "")
+    return match.group(0) if match else ""
+
+
+# ------------------ CV ------------------
+def extract_cv_text(data, filename, config, pool=None):
+    # Returns the cv_extract.ExtractionResult; `.text` is the extracted text.
+    with METRICS.timer("cv_extract", bytes_in=len(data)):
+        return extract_cv(
+            data,
+            filename,
+            pool=pool,
+            max_file_bytes=int(config.get("CV_MAX_FILE_BYTES", 10_000_000)),
+            max_pages=int(config.get("CV_MAX_PAGES", 50)),
+            time_budget=float(config.get("CV_EXTRACT_SECONDS", 20))
+        )
+
+
+def autofill_profile(cv_text, router, config, on_local=None):
+    # A local pass fills what it can find with confidence; only the fields under
+    # CV_LOCAL_CONFIDENCE go to the LLM, as a map-reduce over section-aware chunks
+    # of the whole CV. The chunks of one CV are admitted together as one fan-out,
+    # so the per-user concurrency limit doesn't serialise them.
+    from cv_parse import autofill_cv  # cv_parse imports this module's field definitions
+
+    def extract_chunk(chunk, index, total, fields):
+        prompt = (
+            CV_PARSE_PROMPT
+            + f"Only fill these fields and leave the others empty: {', '.join(fields)}. "
+            + (f"This is part {index + 1} of {total} of the CV: fill only what this part contains. "
+               if total > 1 else "")
+            + f"Parse the CV text below:\n\n{chunk}"
+        )
+        filled = router.chat_json("cv_autofill", [{"role": "user", "content": prompt}])
+        if not isinstance(filled, dict):
+            raise LLMError("Unexpected format from OpenAI.")
+        return filled
+
+    max_workers = int(config.get("CV_PARSE_WORKERS", 6))
+    with fan_out(max_workers):
+        return autofill_cv(
+            cv_text,
+            extract_chunk,
+            threshold=float(config.get("CV_LOCAL_CONFIDENCE", 0.75)),
+            on_local=on_local,
+            max_chars=int(config.get("CV_CHUNK_CHARS", 2500)),
+            max_chunks=int(config.get("CV_MAX_CHUNKS", 12)),
+            max_workers=max_workers
+        )
+
+
+class Engine:
+    # The app's shared resources for headless use, created once on first access
+    # (from any thread).
+    def __init__(self, config):
+        self.config = config
+        self._resources = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, create):
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = create()
+            return self._resources[name]
+
+    @property
+    def backend(self):
+        return self._get("backend", lambda: create_profile_backend(self.config))
+
+    @property
+    def blobs(self):
+        return self._get("blobs", lambda: create_cv_blob_store(self.config))
+
+    @property
+    def scheduler(self):
+        return self._get("scheduler", lambda: create_scheduler(self.config))
+
+    @property
+    def router(self):
+        scheduler = self.scheduler
+        return self._get("router", lambda: create_router(self.config, create_gateway(self.config, scheduler)))
+
+    @property
+    def pool(self):
+        return self._get("pool", lambda: create_extract_pool(self.config))
+
+    def extract_cv_text(self, data, filename):
+        return extract_cv_text(data, filename, self.config, pool=self.pool)
+
+    def autofill_profile(self, cv_text, on_local=None):
+        return autofill_profile(cv_text, self.router, self.config, on_local=on_local)
+
+    def close(self):
+        with self._lock:
+            pool = self._resources.pop("pool", None)
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
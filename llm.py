@@ -0,0 +1,326 @@
+import asyncio
+import contextlib
+import json
+import random
+import threading
+import time
+import weakref
+
+from metrics import METRICS
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+# ------------------ CIRCUIT BREAKER ------------------
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive failed calls and fails fast until
+    # `reset_timeout` has passed; then lets one trial call through (half-open).
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def enter(self):
+        # None when the call is refused; otherwise whether it is the half-open
+        # trial, which must end in record_success, record_failure or end_trial.
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return None
+            self._trial_running = True
+            return True
+
+    def allow(self):
+        return self.enter() is not None
+
+    def end_trial(self):
+        # A trial call that ended without an outcome (e.g. a stream the reader
+        # stopped consuming) lets the next call be the trial.
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# ------------------ GATEWAY ------------------
+def _is_retryable(error):
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def _counts_as_outage(error):
+    # Client errors such as 400 or 404 are about the request, not the model's
+    # health, so they don't count towards the breaker.
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in RETRYABLE_STATUS
+    return True
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class LLMGateway:
+    # Single entry point for chat completions. Owns one pooled sync client and one
+    # async client per event loop, applies timeouts, jittered exponential backoff on
+    # 429/5xx/connection errors, and a circuit breaker per model shared by every
+    # caller, so a failing primary model doesn't shut out its fallback.
+    # `base_url` lets the gateway point at a local fake OpenAI server.
+    def __init__(self, api_key, base_url=None, timeout=30.0, max_retries=3, backoff=0.5,
+                 max_backoff=8.0, max_connections=20, failure_threshold=5, reset_timeout=30.0,
+                 scheduler=None):
+        # openai/httpx are imported here rather than at module level so pages that
+        # never call the model (e.g. the login screen) don't pay for the import.
+        import httpx
+        import openai
+
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_connections = max_connections
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        # Optional admission control (llm_scheduler.FairScheduler) shared by every call.
+        self.scheduler = scheduler
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0}
+        self._client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0,
+            http_client=httpx.Client(limits=self._limits(), timeout=timeout)
+        )
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        import httpx
+
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    def _async_client(self):
+        # httpx async pools are bound to the loop that created them.
+        import httpx
+        import openai
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = openai.AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+                )
+                self._async_clients[loop] = client
+            return client
+
+    async def aclose(self):
+        # Closes this loop's async client. Call it before a short-lived loop (an
+        # asyncio.run) ends, or its connections are never released.
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def _delay(self, attempt, error):
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def breaker(self, model):
+        with self._lock:
+            breaker = self.breakers.get(model)
+            if breaker is None:
+                breaker = self.breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def breaker_states(self):
+        with self._lock:
+            breakers = dict(self.breakers)
+        return {model: breaker.state for model, breaker in sorted(breakers.items())}
+
+    def _admit(self, breaker):
+        trial = breaker.enter()
+        if trial is None:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError("OpenAI is unavailable right now; please try again shortly.")
+        self.stats["calls"] += 1
+        return trial
+
+    def _give_up(self, error, breaker):
+        self.stats["failures"] += 1
+        if _counts_as_outage(error):
+            breaker.record_failure()
+        raise LLMError(str(error)) from error
+
+    def _slot(self, op, params):
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.slot(op, params)
+
+    def _aslot(self, op, params):
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.aslot(op, params)
+
+    def create(self, op="chat", retries=None, **params):
+        # `retries` overrides max_retries for one call (e.g. 0 when a fallback exists).
+        retries = self.max_retries if retries is None else retries
+        with self._slot(op, params) as ticket:
+            breaker = self.breaker(params.get("model"))
+            trial = self._admit(breaker)
+            try:
+                with METRICS.timer(f"openai.{op}") as timer:
+                    for attempt in range(retries + 1):
+                        try:
+                            response = self._client.chat.completions.create(**params)
+                        except Exception as e:
+                            if attempt < retries and _is_retryable(e):
+                                self.stats["retries"] += 1
+                                time.sleep(self._delay(attempt, e))
+                                continue
+                            self._give_up(e, breaker)
+                        breaker.record_success()
+                        _record_usage(timer, getattr(response, "usage", None), ticket)
+                        return response
+            finally:
+                if trial:
+                    breaker.end_trial()
+
+    async def acreate(self, op="chat", retries=None, **params):
+        retries = self.max_retries if retries is None else retries
+        async with self._aslot(op, params) as ticket:
+            breaker = self.breaker(params.get("model"))
+            trial = self._admit(breaker)
+            try:
+                client = self._async_client()
+                with METRICS.timer(f"openai.{op}") as timer:
+                    for attempt in range(retries + 1):
+                        try:
+                            response = await client.chat.completions.create(**params)
+                        except Exception as e:
+                            if attempt < retries and _is_retryable(e):
+                                self.stats["retries"] += 1
+                                await asyncio.sleep(self._delay(attempt, e))
+                                continue
+                            self._give_up(e, breaker)
+                        breaker.record_success()
+                        _record_usage(timer, getattr(response, "usage", None), ticket)
+                        return response
+            finally:
+                if trial:
+                    breaker.end_trial()
+
+    def chat(self, messages, model, op="chat", **params):
+        response = self.create(op=op, model=model, messages=messages, **params)
+        return response.choices[0].message.content or ""
+
+    async def achat(self, messages, model, op="chat", **params):
+        response = await self.acreate(op=op, model=model, messages=messages, **params)
+        return response.choices[0].message.content or ""
+
+    def chat_json(self, messages, model, op="chat", **params):
+        content = self.chat(messages, model, op=op, **params).strip()
+        try:
+            return json.loads(content)
+        except ValueError as e:
+            raise LLMError(f"OpenAI returned invalid JSON: {e}") from e
+
+    def stream(self, messages, model, op="chat", retries=None, usage=None, **params):
+        # Retries are only possible before the first token has been yielded.
+        # `usage`, if given, is filled with the token counts once the stream ends.
+        retries = self.max_retries if retries is None else retries
+        with self._slot(op, dict(params, messages=messages)) as ticket:
+            breaker = self.breaker(model)
+            trial = self._admit(breaker)
+            try:
+                with METRICS.timer(f"openai.{op}") as timer:
+                    for attempt in range(retries + 1):
+                        started = False
+                        try:
+                            for chunk in self._client.chat.completions.create(
+                                model=model, messages=messages, stream=True,
+                                stream_options={"include_usage": True}, **params
+                            ):
+                                _record_usage(timer, getattr(chunk, "usage", None), ticket)
+                                if usage is not None and getattr(chunk, "usage", None) is not None:
+                                    usage["prompt_tokens"] = chunk.usage.prompt_tokens or 0
+                                    usage["completion_tokens"] = chunk.usage.completion_tokens or 0
+                                if not chunk.choices:
+                                    continue
+                                token = chunk.choices[0].delta.content
+                                if token:
+                                    started = True
+                                    yield token
+                        except Exception as e:
+                            if not started and attempt < retries and _is_retryable(e):
+                                self.stats["retries"] += 1
+                                time.sleep(self._delay(attempt, e))
+                                continue
+                            self._give_up(e, breaker)
+                        breaker.record_success()
+                        return
+            finally:
+                if trial:
+                    breaker.end_trial()
+
+
+def _record_usage(timer, usage, ticket=None):
+    if usage is not None:
+        if ticket is not None:
+            # Lets the scheduler correct its token estimate with the real usage.
+            ticket.used = (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+        timer.add(
+            prompt_tokens=getattr(usage, "prompt_tokens", 0),
+            completion_tokens=getattr(usage, "completion_tokens", 0)
+        )
@@ -0,0 +1,304 @@
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+
+from llm import LLMError
+from metrics import METRICS, current_user
+
+ANONYMOUS = "anonymous"
+
+_on_wait = contextvars.ContextVar("llm_on_wait", default=None)
+_fan_out = contextvars.ContextVar("llm_fan_out", default=1)
+
+
+def set_wait_notifier(callback):
+    # `callback(position, eta_seconds)` is called while a call made from this
+    # context waits in the queue, and `callback(None, None)` once it is admitted.
+    _on_wait.set(callback)
+
+
+@contextlib.contextmanager
+def fan_out(width):
+    # Calls made inside this block, including from worker threads running copies
+    # of its context, are parts of one request split `width` ways (e.g. the CV
+    # chunks of one upload). Up to `width` of the user's calls may then run at
+    # once instead of the usual per-user limit.
+    token = _fan_out.set(max(1, int(width)))
+    try:
+        yield
+    finally:
+        _fan_out.reset(token)
+
+
+class AdmissionError(LLMError):
+    pass
+
+
+class QuotaExceededError(AdmissionError):
+    pass
+
+
+class QueueTimeoutError(AdmissionError):
+    pass
+
+
+def estimate_tokens(params):
+    # Roughly 4 characters per prompt token, plus the completion allowance.
+    chars = sum(len(str(m.get("content", ""))) for m in params.get("messages") or [])
+    return chars // 4 + int(params.get("max_tokens") or 500)
+
+
+class TokenBucket:
+    # Tokens-per-minute budget refilled continuously. Not thread-safe on its own;
+    # the scheduler's lock guards it.
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        # Seconds until `amount` tokens are available; a call bigger than the
+        # whole bucket only has to wait for a full one.
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+    def give(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Ticket:
+    def __init__(self, user, op, tokens, concurrency):
+        self.user = user
+        self.op = op
+        self.tokens = tokens
+        self.concurrency = concurrency
+        self.used = None
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.admitted = threading.Event()
+
+
+# ------------------ SCHEDULER ------------------
+class FairScheduler:
+    # Admission control in front of every OpenAI call. Calls queue per user (the
+    # metrics user of the calling context) and are admitted round-robin across
+    # users, so one user's burst can't starve everyone else, whenever a
+    # concurrency slot is free and both the global and the user's tokens-per-minute
+    # buckets cover the call's estimated tokens. Estimates are corrected with the
+    # real usage when the call finishes.
+    def __init__(self, tokens_per_minute=90000, max_concurrent=8, user_tokens_per_minute=20000,
+                 user_concurrency=2, user_max_queued=20, max_wait=60.0, poll=0.05):
+        self.max_concurrent = max_concurrent
+        self.user_tokens_per_minute = user_tokens_per_minute
+        self.user_concurrency = user_concurrency
+        self.user_max_queued = user_max_queued
+        self.max_wait = max_wait
+        self.poll = poll
+        self.bucket = TokenBucket(tokens_per_minute)
+        self.running = 0
+        self.stats = {"admitted": 0, "waited": 0, "rejected": 0, "timeouts": 0, "peak_depth": 0}
+        self._service = 2.0
+        self._queues = OrderedDict()
+        self._running = {}
+        self._user_buckets = {}
+        self._lock = threading.Lock()
+
+    def _user_bucket(self, user):
+        bucket = self._user_buckets.get(user)
+        if bucket is None:
+            bucket = self._user_buckets[user] = TokenBucket(self.user_tokens_per_minute)
+        return bucket
+
+    def _depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _gauges(self):
+        METRICS.gauge("llm_queue_depth", self._depth())
+        METRICS.gauge("llm_running", self.running)
+
+    def _enqueue(self, op, params):
+        ticket = _Ticket(current_user() or ANONYMOUS, op, estimate_tokens(params),
+                         max(self.user_concurrency, _fan_out.get()))
+        with self._lock:
+            queue = self._queues.setdefault(ticket.user, deque())
+            if len(queue) >= self.user_max_queued:
+                if not queue:
+                    del self._queues[ticket.user]
+                self.stats["rejected"] += 1
+                METRICS.incr("llm_rejected")
+                raise QuotaExceededError("You have too many AI requests waiting; please let them finish first.")
+            queue.append(ticket)
+            self._dispatch()
+            if not ticket.admitted.is_set():
+                self.stats["waited"] += 1
+                self.stats["peak_depth"] = max(self.stats["peak_depth"], self._depth())
+                METRICS.incr("llm_queued")
+            self._gauges()
+        return ticket
+
+    def _dispatch(self):
+        # Caller holds the lock. Users that were just served move to the back.
+        while self.running < self.max_concurrent:
+            for user, queue in self._queues.items():
+                ticket = queue[0]
+                if self._running.get(user, 0) >= ticket.concurrency:
+                    continue
+                if self._user_bucket(user).wait_for(ticket.tokens):
+                    continue
+                if self.bucket.wait_for(ticket.tokens):
+                    # Out of global tokens: nobody jumps the queue.
+                    return
+                break
+            else:
+                return
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self.bucket.take(ticket.tokens)
+            self._user_bucket(user).take(ticket.tokens)
+            self.running += 1
+            self._running[user] = self._running.get(user, 0) + 1
+            ticket.started = time.monotonic()
+            ticket.admitted.set()
+
+    def _position(self, ticket):
+        # Estimate: the calls ahead in the user's own queue, plus up to as many
+        # from every other waiting user, since admission alternates between users.
+        queue = self._queues.get(ticket.user, ())
+        ahead = queue.index(ticket) if ticket in queue else 0
+        others = sum(min(len(q), ahead + 1) for user, q in self._queues.items() if user != ticket.user)
+        return ahead + others + 1
+
+    def _check(self, ticket):
+        # One polling step for a waiting call: returns None once admitted, else
+        # (position, eta). Raises when the call has waited longer than max_wait; the
+        # caller then abandons the ticket.
+        with self._lock:
+            self._dispatch()
+            self._gauges()
+            if ticket.admitted.is_set():
+                return None
+            if time.monotonic() - ticket.enqueued > self.max_wait:
+                self.stats["timeouts"] += 1
+                METRICS.incr("llm_queue_timeouts")
+                raise QueueTimeoutError("The AI service is busy right now; please try again in a minute.")
+            position = self._position(ticket)
+            eta = max(position * self._service / self.max_concurrent, self.bucket.wait_for(ticket.tokens))
+            return position, round(eta)
+
+    def _admitted(self, ticket, notify):
+        if notify:
+            notify(None, None)
+        with self._lock:
+            self.stats["admitted"] += 1
+        METRICS.observe("llm_queue_wait", ticket.started - ticket.enqueued, user=ticket.user)
+
+    def _abandon(self, ticket):
+        # A call leaving before it ran (queue timeout, cancellation, or its wait
+        # notifier raising) is taken out of its queue, or gives its slot back if
+        # it was admitted in the meantime.
+        with self._lock:
+            if not ticket.admitted.is_set():
+                queue = self._queues.get(ticket.user)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[ticket.user]
+                self._dispatch()
+                self._gauges()
+                return
+        self.release(ticket)
+
+    def release(self, ticket):
+        with self._lock:
+            self.running -= 1
+            self._running[ticket.user] -= 1
+            if not self._running[ticket.user]:
+                del self._running[ticket.user]
+            if ticket.used is not None:
+                refund = ticket.tokens - ticket.used
+                for bucket in (self.bucket, self._user_bucket(ticket.user)):
+                    if refund > 0:
+                        bucket.give(refund)
+                    else:
+                        bucket.take(-refund)
+            self._service = 0.8 * self._service + 0.2 * (time.monotonic() - ticket.started)
+            self._dispatch()
+            self._gauges()
+
+    @contextlib.contextmanager
+    def slot(self, op, params):
+        ticket = self._enqueue(op, params)
+        notify = _on_wait.get()
+        notified = None
+        try:
+            while not ticket.admitted.wait(self.poll):
+                waiting = self._check(ticket)
+                if waiting is None:
+                    break
+                if notify and waiting != notified:
+                    notify(*waiting)
+                    notified = waiting
+            self._admitted(ticket, notify if notified else None)
+        except BaseException as e:
+            self._abandon(ticket)
+            if notified and isinstance(e, QueueTimeoutError):
+                notify(None, None)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, op, params):
+        ticket = self._enqueue(op, params)
+        notify = _on_wait.get()
+        notified = None
+        try:
+            while not ticket.admitted.is_set():
+                await asyncio.sleep(self.poll)
+                waiting = self._check(ticket)
+                if waiting is None:
+                    break
+                if notify and waiting != notified:
+                    notify(*waiting)
+                    notified = waiting
+            self._admitted(ticket, notify if notified else None)
+        except BaseException as e:
+            self._abandon(ticket)
+            if notified and isinstance(e, QueueTimeoutError):
+                notify(None, None)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def status(self):
+        with self._lock:
+            return {
+                "queued": self._depth(),
+                "running": self.running,
+                "users_waiting": len(self._queues),
+                "tokens_available": int(max(0, self.bucket.tokens)),
+                "avg_call_seconds": round(self._service, 2),
+                **self.stats,
+            }
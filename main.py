@@ -1,56 +1,128 @@
 import streamlit as st
-import openai
+import atexit
+import copy
 import json
-import os
 import pathlib
 import datetime
-from fpdf import FPDF
-import docx2txt
-import PyPDF2
+import threading
+import time
 
 st.set_page_config(page_title="AI Interview Coach", layout="wide", initial_sidebar_state="expanded")
 
+# ------------------ INSTRUMENTATION ------------------
+from metrics import METRICS, set_user
+
+# Secrets may hold the flag as a TOML boolean or as a string such as "false".
+METRICS.enabled = str(st.secrets.get("METRICS_ENABLED", True)).strip().lower() not in ("0", "false", "no", "off", "")
+RERUN_STARTED = time.perf_counter()
+set_user(st.session_state.get("username"))
+
+@st.cache_resource
+def get_process_state():
+    return {"runs": 0}
+
+# The first run in a process pays for module imports and building cached
+# resources, so it is tracked separately from ordinary reruns.
+get_process_state()["runs"] += 1
+RUN_KIND = "script_cold_start" if get_process_state()["runs"] == 1 else "script_rerun"
+RUN_BUDGETS = {
+    "script_cold_start": float(st.secrets.get("COLD_START_BUDGET_SECONDS", 3.0)),
+    "script_rerun": float(st.secrets.get("RERUN_BUDGET_SECONDS", 0.5)),
+}
+
+def record_rerun():
+    elapsed = time.perf_counter() - RERUN_STARTED
+    METRICS.observe(RUN_KIND, elapsed)
+    if elapsed > RUN_BUDGETS[RUN_KIND]:
+        METRICS.incr(f"{RUN_KIND}_over_budget")
+
+# st.stop() and st.rerun() end the script by raising, so they go through these
+# helpers to record how long the rerun took.
+def stop_script():
+    record_rerun()
+    st.stop()
+
+def rerun_script():
+    record_rerun()
+    st.rerun()
+
 # ------------------ PROFILE LOADING ------------------
-import requests
+from storage import PENDING_KEY, REV_KEY, rev_of
+from save_queue import WriteBehindQueue, apply_changes, diff_record
+from answer_cache import AnswerCache, cache_key, profile_fingerprint
+from retrieval import ProfileIndex
+from cv_ingest import CVIngestCache, file_digest
+from question_pool import QuestionPool
+from llm import LLMError
+from llm_scheduler import set_wait_notifier
+from role_questions import RoleQuestionBank
+from batch_answers import parse_questions, run_batch, to_csv, to_markdown
+from blob_store import externalize_cv, with_cv_text
+from engine import (
+    apply_cv_fields, autofill_profile, create_cv_blob_store, create_extract_pool, create_gateway,
+    create_profile_backend, create_router, create_scheduler, extract_cv_text as engine_extract_cv_text,
+    new_profile_record
+)
+from user_directory import UserDirectory, approve_signups, deny_signups, pending_requests, set_admin
 
-def load_profiles():
-    headers = {"Authorization": f"token {st.secrets['GITHUB_TOKEN']}"}
-    gist_url = f"https://api.github.com/gists/{st.secrets['GIST_ID']}"
+@st.cache_resource
+def get_profile_backend():
+    return create_profile_backend(st.secrets)
+
+def load_profiles(username=None):
+    # Regular users only need their own record; admins need the full directory.
+    backend = get_profile_backend()
     try:
-        res = requests.get(gist_url, headers=headers)
-        res.raise_for_status()
-        gist_data = res.json()
-        content = gist_data["files"]["profiles.json"]["content"]
-        return json.loads(content)
+        if username is None:
+            return backend.load_all()
+        record = backend.load_user(username)
+        if record and (record.get("is_admin") or record.get("super_admin")):
+            return backend.load_all()
+        return {username: record} if record else {}
     except Exception as e:
-        st.warning(f"Could not load profiles from Gist: {e}")
+        st.warning(f"Could not load profiles: {e}")
         return {}
 
-def save_profiles(profiles):
-    headers = {
-        "Authorization": f"token {st.secrets['GITHUB_TOKEN']}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    gist_url = f"https://api.github.com/gists/{st.secrets['GIST_ID']}"
-    updated_data = {
-        "files": {
-            "profiles.json": {
-                "content": json.dumps(profiles, indent=2)
-            }
-        }
-    }
-    try:
-        res = requests.patch(gist_url, headers=headers, data=json.dumps(updated_data))
-        res.raise_for_status()
-    except Exception as e:
-        st.error(f"Failed to save profiles to Gist: {e}")
+@st.cache_resource
+def get_blob_store():
+    # None when no blob store is configured, which keeps CV text inline.
+    return create_cv_blob_store(st.secrets)
+
+@st.cache_resource
+def get_save_queue():
+    queue = WriteBehindQueue(
+        get_profile_backend(),
+        debounce=float(st.secrets.get("SAVE_DEBOUNCE_SECONDS", 1.0))
+    )
+    atexit.register(queue.close)
+    return queue
+
+def save_profiles(profiles, usernames=None):
+    # Queue field-level changes against the last saved copy of each record; the
+    # write-behind worker merges bursts into one backend write per debounce window.
+    queue = get_save_queue()
+    saved = st.session_state.setdefault("saved_profiles", {})
+    queued = st.session_state.setdefault("queued_usernames", set())
+    for u in (usernames if usernames is not None else list(profiles)):
+        queued.add(u)
+        record = profiles.get(u)
+        if record is None:
+            queue.delete(u)
+            saved.pop(u, None)
+        else:
+            queue.submit(u, diff_record(saved.get(u), record))
+            saved[u] = copy.deepcopy(record)
 
 # ------------------ LOGIN SYSTEM ------------------
 def check_login(username, password):
     username = username.strip().lower()
-    # Check Gist profiles first
-    all_profiles = st.session_state.get("profiles", {})
-    if username in all_profiles and all_profiles[username].get("settings", {}).get("password") == password:
+    # Check stored profiles first
+    try:
+        record = get_profile_backend().load_user(username)
+    except Exception as e:
+        st.warning(f"Could not load profiles: {e}")
+        record = None
+    if record and record.get("settings", {}).get("password") == password:
         return True
     # Fallback to secrets
     users = st.secrets.get("users", {})
@@ -64,7 +136,7 @@ if "login_attempted" not in st.session_state:
     st.session_state.login_attempted = False
 
 if "profiles" not in st.session_state:
-    st.session_state.profiles = load_profiles()
+    st.session_state.profiles = {}
 
 if not st.session_state.authenticated:
     st.title("🔐 Login to Access AI Interview Coach")
@@ -79,7 +151,7 @@ if not st.session_state.authenticated:
             if check_login(username, password):
                 st.session_state.authenticated = True
                 st.session_state.username = username.strip().lower()
-                st.rerun()
+                rerun_script()
             else:
                 st.session_state.login_attempted = True
         if st.session_state.login_attempted:
@@ -95,88 +167,178 @@ if not st.session_state.authenticated:
         if submitted_signup:
             if new_password != confirm_password:
                 st.error("Passwords do not match.")
-            elif new_username.strip().lower() in st.session_state.profiles:
+            elif load_profiles(new_username.strip().lower()):
                 st.error("Username already exists.")
             else:
-                all_profiles = st.session_state.profiles
-                if "pending_signups" not in all_profiles:
-                    all_profiles["pending_signups"] = []
-                all_profiles["pending_signups"].append({
+                stored_signups = get_profile_backend().load_user(PENDING_KEY)
+                request = {
                     "email": new_email,
                     "username": new_username.strip().lower(),
                     "password": new_password
-                })
-                save_profiles(all_profiles)
-                st.session_state.profiles = all_profiles
-                st.success("Signup request sent for approval.")
+                }
+                if request["username"] in pending_requests(stored_signups):
+                    st.error("This username is already awaiting approval.")
+                else:
+                    if isinstance(stored_signups, list):
+                        # Old list format: convert it once, then later signups only add their own key.
+                        signups = pending_requests(stored_signups)
+                        signups[request["username"]] = request
+                        get_save_queue().submit(PENDING_KEY, {(): signups})
+                    else:
+                        get_save_queue().submit(PENDING_KEY, {(request["username"],): request})
+                    st.success("Signup request sent for approval.")
 
-    st.stop()
+    stop_script()
+
+# ------------------ SHARED PROFILE CACHE ------------------
+# Every session reads through the process-wide backend cache (a memory hit within
+# the TTL, a 304 when the Gist is unchanged). A new backend version only means
+# some record moved: each session then checks the revisions of the records it
+# holds and takes just the ones that changed, unless its own writes are still
+# queued (other sessions' writes don't hold it back).
+profile_backend = get_profile_backend()
+try:
+    profile_backend.revalidate()
+except Exception as e:
+    st.warning(f"Could not refresh profiles: {e}")
+
+def is_admin_record(record):
+    return bool(record and (record.get("is_admin") or record.get("super_admin")))
+
+def take_record(u, record, profiles, saved):
+    # The stored record becomes the new saved copy; this session's unsaved edits
+    # to it are replayed on top, so a half-filled form survives another user's save.
+    local = profiles.get(u)
+    unsaved = {}
+    if isinstance(local, dict) and isinstance(record, dict) and u in saved:
+        unsaved = diff_record(saved[u], local)
+        unsaved.pop((REV_KEY,), None)
+    if record is None:
+        profiles.pop(u, None)
+        saved.pop(u, None)
+        return
+    saved[u] = copy.deepcopy(record)
+    profiles[u] = apply_changes(copy.deepcopy(record), unsaved)
+
+def refresh_profiles():
+    username = st.session_state.username
+    profiles = st.session_state.profiles
+    saved = st.session_state.get("saved_profiles")
+    if not saved or username not in saved:
+        st.session_state.profiles = load_profiles(username)
+        st.session_state.saved_profiles = copy.deepcopy(st.session_state.profiles)
+        st.session_state.pop("user_directory", None)
+        return
+    was_admin = is_admin_record(saved[username])
+    try:
+        if was_admin:
+            # Admins hold the whole directory, so they only fetch, copy and
+            # re-index the records whose revision moved.
+            changed = profile_backend.load_changed({u: rev_of(record) for u, record in saved.items()})
+        else:
+            record = profile_backend.load_user(username)
+            changed = {username: record} if rev_of(record) != rev_of(saved[username]) else {}
+    except Exception as e:
+        st.warning(f"Could not load profiles: {e}")
+        return
+    if username in changed and is_admin_record(changed[username]) != was_admin:
+        # Gaining or losing admin rights changes which records this session holds.
+        fresh = load_profiles(username)
+        changed = dict(fresh, **{u: None for u in profiles if u not in fresh})
+        st.session_state.pop("user_directory", None)
+    for u, record in changed.items():
+        take_record(u, record, profiles, saved)
+    if changed and "user_directory" in st.session_state:
+        st.session_state.user_directory.refresh(profiles, changed)
+
+if st.session_state.get("profiles_version") != profile_backend.version and not get_save_queue().is_pending(st.session_state.get("queued_usernames", ())):
+    st.session_state.queued_usernames = set()
+    st.session_state.profiles_version = profile_backend.version
+    refresh_profiles()
+
+# ------------------ USER DIRECTORY ------------------
+USERS_PER_PAGE = int(st.secrets.get("ADMIN_USERS_PER_PAGE", 25))
+ROLE_LABELS = {"pending": "Pending", "user": "User", "admin": "Admin", "super_admin": "Super admin"}
+
+def get_user_directory():
+    # Built once per session; reloads and admin actions re-index just the
+    # records they touch.
+    if "user_directory" not in st.session_state:
+        st.session_state.user_directory = UserDirectory(st.session_state.profiles)
+    return st.session_state.user_directory
+
+def render_user_directory(key, roles, actions):
+    # Search, role filter and one page of results; ticking boxes happens inside a
+    # form so it doesn't rerun the script. Returns (action, selected usernames).
+    directory = get_user_directory()
+    query = st.text_input("Search username or email", key=f"{key}_query")
+    if len(roles) > 1:
+        role_filter = st.selectbox("Role", ["All"] + [ROLE_LABELS[r] for r in roles], key=f"{key}_role")
+        if role_filter != "All":
+            roles = [r for r in roles if ROLE_LABELS[r] == role_filter]
+    entries, total, pages = directory.page(query, roles, st.session_state.get(f"{key}_page", 1), USERS_PER_PAGE)
+    if not total:
+        st.info("No pending signups." if roles == ["pending"] else "No matching users.")
+        return None, []
+    page = min(st.session_state.get(f"{key}_page", 1), pages)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("◀", key=f"{key}_prev", disabled=page <= 1):
+        st.session_state[f"{key}_page"] = page - 1
+        rerun_script()
+    col2.caption(f"Page {page} of {pages} · {total} match(es)")
+    if col3.button("▶", key=f"{key}_next", disabled=page >= pages):
+        st.session_state[f"{key}_page"] = page + 1
+        rerun_script()
+
+    selected = []
+    clicked = None
+    with st.form(f"{key}_form"):
+        for entry in entries:
+            locked = entry["username"] == st.session_state.username or entry["role"] == "super_admin"
+            label = f"{entry['username']} · {entry['email'] or 'no email'} · {ROLE_LABELS[entry['role']]}"
+            if st.checkbox(label, key=f"{key}_select_{entry['username']}", disabled=locked):
+                selected.append(entry["username"])
+        for action, label in actions.items():
+            if st.form_submit_button(label):
+                clicked = action
+    return clicked, selected
 
 # ------------------ DELETE CONFIRMATION POPUP ------------------
 all_profiles = st.session_state.profiles
-if st.session_state.get("confirm_delete_user"):
-    user_to_delete = st.session_state["confirm_delete_user"]
-    st.warning(f"Are you sure you want to delete user: {user_to_delete}?")
+if st.session_state.get("confirm_delete_users"):
+    users_to_delete = st.session_state["confirm_delete_users"]
+    st.warning(f"Are you sure you want to delete {len(users_to_delete)} user(s): {', '.join(users_to_delete)}?")
     col1, col2 = st.columns([1, 1])
-    if col1.button("✅ Yes, delete user"):
-        if all_profiles.get(user_to_delete, {}).get("super_admin"):
-            st.error("❌ This user is a super admin and cannot be deleted.")
-        else:
-            del all_profiles[user_to_delete]
-            save_profiles(all_profiles)
-            st.success(f"User {user_to_delete} deleted.")
-        del st.session_state["confirm_delete_user"]
-        st.rerun()
+    if col1.button("✅ Yes, delete"):
+        protected = [u for u in users_to_delete if all_profiles.get(u, {}).get("super_admin")]
+        if protected:
+            st.error(f"❌ Super admins cannot be deleted: {', '.join(protected)}")
+        deleted = [u for u in users_to_delete if u in all_profiles and u not in protected]
+        for user in deleted:
+            del all_profiles[user]
+        save_profiles(all_profiles, deleted)
+        get_user_directory().refresh(all_profiles, deleted)
+        st.success(f"Deleted {len(deleted)} user(s).")
+        del st.session_state["confirm_delete_users"]
+        rerun_script()
     if col2.button("❌ Cancel"):
-        del st.session_state["confirm_delete_user"]
-        st.rerun()
+        del st.session_state["confirm_delete_users"]
+        rerun_script()
 
 # ------------------ DARK MODE TOGGLE ------------------
 if "dark_mode" not in st.session_state:
     st.session_state.dark_mode = False
 
+@st.cache_resource
+def load_dark_mode_css():
+    return (pathlib.Path(__file__).parent / "assets" / "dark_mode.css").read_text()
+
 with st.sidebar:
     dark_mode_toggle = st.checkbox("🌙 Enable Dark Mode", value=st.session_state.dark_mode)
     st.session_state.dark_mode = dark_mode_toggle
 
 if st.session_state.dark_mode:
-    st.markdown("""
-        <style>
-        html, body, .stApp {
-            background-color: #0e1117;
-            color: #f0f0f0;
-        }
-        .stTextInput input, .stTextArea textarea {
-            background-color: #262730;
-            color: #f0f0f0;
-        }
-        .stButton>button {
-            background-color: #202231;
-            color: #ffffff;
-        }
-        .stTabs [data-baseweb="tab"] {
-            background-color: #1e1e2f;
-            color: #f0f0f0;
-        }
-        .stSidebar {
-            background-color: #111827;
-        }
-        .stFileUploader, .stFileUploader label {
-            background-color: #262730;
-            color: #f0f0f0;
-        }
-        .streamlit-expanderHeader {
-            background-color: #1e1e2f;
-            color: #f0f0f0;
-        }
-        .streamlit-expanderContent {
-            background-color: #0e1117;
-        }
-        a {
-            color: #58a6ff;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(f"<style>{load_dark_mode_css()}</style>", unsafe_allow_html=True)
 
 # ------------------ LOGOUT ------------------
 username = st.session_state.username
@@ -189,183 +351,270 @@ with st.sidebar:
         else:
           st.markdown("🛡️ **Admin Account**")
 
+    save_status = get_save_queue().status(username)
+    if save_status["error"]:
+        st.error(f"Failed to save profile: {save_status['error']}")
+    elif save_status["pending"]:
+        st.caption("💾 Saving changes...")
+    elif save_status["committed_at"]:
+        saved_at = datetime.datetime.fromtimestamp(save_status["committed_at"]).strftime("%H:%M:%S")
+        st.caption(f"✅ All changes saved ({saved_at})")
+
     if st.button("🚪 Logout"):
+        get_save_queue().flush(timeout=10)
         for key in list(st.session_state.keys()):
             del st.session_state[key]
-        st.rerun()
+        rerun_script()
 
     if all_profiles.get(username, {}).get("is_admin") or all_profiles.get(username, {}).get("super_admin"):
         with st.expander("🧾 Approve Sign Ups"):
-            pending = all_profiles.get("pending_signups", [])
-            if pending:
-                for i, req in enumerate(pending):
-                    st.write(f"**{req['username']}** ({req['email']})")
-                    col1, col2 = st.columns([1, 1])
-                    if col1.button(f"✅ Approve {i}"):
-                        all_profiles[req["username"]] = {
-                            "settings": {
-                                "username": req["username"],
-                                "password": req["password"]
-                            },
-                            "is_admin": False,
-                            "profile": {
-                                "name": "",
-                                "title": "",
-                                "location": "",
-                                "experience": [],
-                                "skills": [],
-                                "softSkills": [],
-                                "learning": [],
-                                "certifications": [],
-                                "goals": "",
-                                "cvText": ""
-                            },
-                            "advanced": []
-                        }
-                        save_profiles(all_profiles)
-                        del all_profiles["pending_signups"][i]
-                        st.rerun()
-                    if col2.button(f"❌ Deny {i}"):
-                        del all_profiles["pending_signups"][i]
-                        save_profiles(all_profiles)
-                        st.rerun()
-            else:
-                st.info("No pending signups.")
+            action, selected = render_user_directory(
+                "signups", ["pending"], {"approve": "✅ Approve selected", "deny": "❌ Deny selected"}
+            )
+            if action and selected:
+                if action == "approve":
+                    changed = approve_signups(all_profiles, selected)
+                else:
+                    changed = deny_signups(all_profiles, selected)
+                # One save for the whole selection; the write-behind queue turns it into one backend write.
+                save_profiles(all_profiles, changed)
+                get_user_directory().refresh(all_profiles, changed)
+                rerun_script()
 
         with st.expander("🧑‍💼 Manage Users"):
-            for user, data in all_profiles.items():
-                if user not in ["pending_signups"] and user != username:
-                    user_settings = data.get("settings", {})
-                    is_super_admin = data.get("super_admin", False)
-                    col1, col2, col3 = st.columns([2, 1, 1], gap="small")
-                    col1.write(f"👤 {user_settings.get('username', user)}")
-                    is_admin = data.get("is_admin", False)
-                    if not is_super_admin and col2.checkbox("Admin", value=is_admin, key=f"admin_toggle_{user}") != is_admin:
-                        all_profiles[user]["is_admin"] = not is_admin
-                        save_profiles(all_profiles)
-                        st.rerun()
-                    if not is_super_admin and col3.button(f"❌ Delete {user}", key=f"delete_user_btn_{user}"):
-                        st.session_state["confirm_delete_user"] = user
-                        st.rerun()
-                    
+            action, selected = render_user_directory(
+                "users", ["user", "admin", "super_admin"],
+                {"promote": "⬆️ Make admin", "demote": "⬇️ Remove admin", "delete": "🗑️ Delete"}
+            )
+            if action and selected:
+                if action == "delete":
+                    st.session_state["confirm_delete_users"] = selected
+                else:
+                    changed = set_admin(all_profiles, selected, action == "promote")
+                    save_profiles(all_profiles, changed)
+                    get_user_directory().refresh(all_profiles, changed)
+                rerun_script()
+            if get_blob_store() is not None and st.button("📦 Move stored CV text to the blob store"):
+                moved = []
+                for user, record in all_profiles.items():
+                    if isinstance(record, dict) and record.get("profile", {}).get("cvText"):
+                        externalize_cv(record, get_blob_store())
+                        moved.append(user)
+                save_profiles(all_profiles, moved)
+                st.success(f"Moved the CV text of {len(moved)} profile(s).")
 
 # ------------------ OPENAI API ------------------
-openai.api_key = st.secrets["OPENAI_API_KEY"]
+@st.cache_resource
+def get_scheduler():
+    # One process-wide admission queue for every OpenAI call: a global
+    # tokens-per-minute budget, per-user quotas, round-robin across users.
+    return create_scheduler(st.secrets)
 
-# ------------------ PROFILE MANAGEMENT ------------------
-PROFILE_STORE = "profiles.json"
+@st.cache_resource
+def get_llm():
+    return create_gateway(st.secrets, scheduler=get_scheduler())
 
-import requests
+@st.cache_resource
+def get_router():
+    # Per-task model, max tokens, temperature, latency budget and fallback; any
+    # [MODEL_ROUTES.<task>] table in secrets overrides the defaults.
+    return create_router(st.secrets, get_llm())
 
-def load_profiles():
-    headers = {"Authorization": f"token {st.secrets['GITHUB_TOKEN']}"}
-    gist_url = f"https://api.github.com/gists/{st.secrets['GIST_ID']}"
-    try:
-        res = requests.get(gist_url, headers=headers)
-        res.raise_for_status()
-        gist_data = res.json()
-        content = gist_data["files"]["profiles.json"]["content"]
-        return json.loads(content)
-    except Exception as e:
-        st.warning(f"Could not load profiles from Gist: {e}")
-        return {}
+llm = get_llm()
+router = get_router()
 
-def save_profiles(profiles):
-    headers = {
-        "Authorization": f"token {st.secrets['GITHUB_TOKEN']}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    gist_url = f"https://api.github.com/gists/{st.secrets['GIST_ID']}"
-    updated_data = {
-        "files": {
-            "profiles.json": {
-                "content": json.dumps(profiles, indent=2)
-            }
-        }
-    }
-    try:
-        res = requests.patch(gist_url, headers=headers, data=json.dumps(updated_data))
-        res.raise_for_status()
-    except Exception as e:
-        st.error(f"Failed to save profiles to Gist: {e}")
+# Shown while one of this session's calls is waiting for the scheduler. Only the
+# script thread may draw; background fetches wait silently.
+llm_queue_notice = st.empty()
+script_thread = threading.get_ident()
 
-def extract_cv_text(uploaded_file):
-    if uploaded_file.name.endswith(".pdf"):
-        reader = PyPDF2.PdfReader(uploaded_file)
-        return "\n".join([page.extract_text() for page in reader.pages if page.extract_text()])
-    elif uploaded_file.name.endswith(".docx"):
-        return docx2txt.process(uploaded_file)
-    return ""
-
-def autofill_profile_from_cv(cv_text):
-    import re
-    # Pre-cleaning: remove excess whitespace, tabs, and bullet characters
-    cleaned_cv = re.sub(r'[•●▪︎◦\-\u2022\u25AA]+', '', cv_text)
-    cleaned_cv = re.sub(r'\n+', '\n', cleaned_cv)
-    trimmed_cv = cleaned_cv[:3000]  # Optional: limit CV text for token safety
+def show_queue_position(position, eta):
+    if threading.get_ident() != script_thread:
+        return
+    if position is None:
+        llm_queue_notice.empty()
+    else:
+        llm_queue_notice.info(f"⏳ The AI is busy: you're #{position} in the queue (about {eta:.0f}s).")
 
-    prompt = (
-        "You are an expert CV parser. Extract the following structured profile information as a JSON object:\n\n"
-        "{\n"
-        "  \"name\": string,\n"
-        "  \"title\": string,\n"
-        "  \"location\": string,\n"
-        "  \"skills\": [string],\n"
-        "  \"softSkills\": [string],\n"
-        "  \"experience\": [string],\n"
-        "  \"certifications\": [string],\n"
-        "  \"learning\": [string],\n"
-        "  \"goals\": string\n"
-        "}\n\n"
-        "Only return valid JSON. Use bullet points from experience and training sections. Parse the CV text below:\n\n"
-        f"{trimmed_cv}"
+set_wait_notifier(show_queue_position)
+
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(
+        max_entries=int(st.secrets.get("ANSWER_CACHE_SIZE", 256)),
+        ttl=float(st.secrets.get("ANSWER_CACHE_TTL_SECONDS", 24 * 3600)),
+        path=st.secrets.get("ANSWER_CACHE_PATH")
     )
+
+def interview_answer_key(question, profile_bundle, task="interview_answer"):
+    # `task` is the route that produces the answer; streamed and non-streamed
+    # answers share cache entries only when their routes use the same model.
+    return cache_key("interview_answer", router.route(task).model, question, profile_fingerprint(profile_bundle))
+
+# ------------------ PROFILE MANAGEMENT ------------------
+@st.cache_resource
+def get_extract_pool():
+    return create_extract_pool(st.secrets)
+
+def extract_cv_text(uploaded_file):
+    result = engine_extract_cv_text(uploaded_file.getvalue(), uploaded_file.name, st.secrets, pool=get_extract_pool())
+    st.session_state.last_cv_extraction = result.report()
+    if result.partial:
+        st.warning(f"Only part of this CV could be read: stopped at the {result.reason}.")
+    return result.text
+
+def autofill_profile_from_cv(cv_text, on_local=None):
+    # Chunks run on worker threads, so on_local is the only place to touch st.*.
+    return autofill_profile(cv_text, router, st.secrets, on_local=on_local)
+
+@st.cache_resource
+def get_cv_cache():
+    return CVIngestCache()
+
+def ingest_cv(uploaded_file, digest):
+    # Extraction and autofill run at most once per file content, process-wide.
+    cache = get_cv_cache()
+    cv_text = cache.extract(digest, lambda: extract_cv_text(uploaded_file))
+    if not cv_text:
+        return cv_text, {}
+    status = st.empty()
+
+    def show_local(local, confidence, missing):
+        # Shown before any LLM call, so the user sees what was found straight away.
+        found = {field: local[field] for field in local if field not in missing}
+        with status.container():
+            if missing:
+                st.info(f"Found {len(found)} field(s) in your CV; asking AI for: {', '.join(missing)}…")
+            else:
+                st.info("Filled your profile from the CV without calling AI.")
+            if found:
+                st.json(found, expanded=False)
+
     try:
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return json.loads(response.choices[0].message.content)
-    except Exception as e:
+        filled = cache.autofill(digest, lambda: autofill_profile_from_cv(cv_text, on_local=show_local))
+    except LLMError as e:
         st.error(f"OpenAI CV analysis error: {e}")
-        return {}
+        filled = {}
+    status.empty()
+    return cv_text, filled
+
+def get_profile_index(profile_bundle):
+    if "profile_index" not in st.session_state:
+        st.session_state.profile_index = ProfileIndex()
+    return st.session_state.profile_index.update(profile_bundle)
 
-def generate_interview_answer(question, profile_bundle):
-    full_profile = profile_bundle["profile"]
-    full_profile["advancedQA"] = profile_bundle.get("advanced", [])
+def interview_answer_messages(question, profile_bundle):
+    # Send the structured fields plus only the CV chunks and past answers that are
+    # relevant to this question, instead of the full CV and every Q&A pair.
+    profile_bundle = with_cv_text(profile_bundle, get_blob_store())
+    base_profile = {k: v for k, v in profile_bundle["profile"].items() if k != "cvText"}
+    snippets = get_profile_index(profile_bundle).search(
+        question,
+        top_k=int(st.secrets.get("RETRIEVAL_TOP_K", 6)),
+        token_budget=int(st.secrets.get("RETRIEVAL_TOKEN_BUDGET", 800))
+    )
+    context = "\n\n".join(
+        f"[{'CV' if s['source'] == 'cv' else 'Past answer'}]\n{s['text']}" for s in snippets
+    )
     system_prompt = (
-        "You are simulating interview responses based on this structured profile and CV content:\n"
-        f"{json.dumps(full_profile)}\n\n"
-        "Answer the following interview question in a clear, friendly, and concise way. Keep the tone approachable and avoid overly formal or robotic phrasing."
+        "You are simulating interview responses based on this structured profile:\n"
+        f"{json.dumps(base_profile)}\n\n"
+        + (f"Relevant CV excerpts and the candidate's own past answers:\n{context}\n\n" if context else "")
+        + "Answer the following interview question in a clear, friendly, and concise way. Keep the tone approachable and avoid overly formal or robotic phrasing."
     )
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": question}
-        ]
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+
+def generate_interview_answer(question, profile_bundle, fresh=False):
+    def compute():
+        return router.chat("interview_answer", interview_answer_messages(question, profile_bundle))
+    return get_answer_cache().get_or_compute(interview_answer_key(question, profile_bundle), compute, fresh=fresh)
+
+def generate_bulk_answers(questions, profile_bundle, on_result, fresh=False):
+    # Prompts are built here on the script thread (retrieval reads session state);
+    # only the OpenAI calls run concurrently, BULK_ANSWER_CONCURRENCY at a time.
+    # Cached answers are served without a call, and new ones are cached.
+    cache = get_answer_cache()
+    prompts = {
+        question: (interview_answer_key(question, profile_bundle), interview_answer_messages(question, profile_bundle))
+        for question in questions
+    }
+
+    async def answer(question):
+        key, messages = prompts[question]
+        cached = None if fresh else cache.get(key)
+        if cached:
+            return cached
+        text = await router.achat("interview_answer", messages)
+        cache.put(key, text)
+        return text
+
+    return run_batch(
+        questions, answer, concurrency=int(st.secrets.get("BULK_ANSWER_CONCURRENCY", 4)), on_result=on_result,
+        on_close=llm.aclose
     )
-    return response.choices[0].message.content
 
-def generate_role_question(title, description, responsibilities):
+def stream_interview_answer(question, profile_bundle, timing):
+    # Yields answer tokens as they arrive and fills `timing` with the
+    # time-to-first-token and total time in seconds.
+    started = time.perf_counter()
+    timing["ttft"] = None
+    for token in router.stream("interview_answer_stream", interview_answer_messages(question, profile_bundle)):
+        if timing["ttft"] is None:
+            timing["ttft"] = time.perf_counter() - started
+        yield token
+    timing["total"] = time.perf_counter() - started
+
+def generate_role_questions(title, description, responsibilities, count):
     prompt = (
         "You are an experienced interviewer preparing questions for a job candidate. "
         f"Role: {title}. Description: {description} "
         f"Responsibilities: {responsibilities}. "
-        "Generate one concise interview question relevant to this position. "
-        "Return only the question text."
+        f"Generate {count} concise, distinct interview questions relevant to this position, "
+        "ranked from most to least relevant. "
+        f"Return only a JSON list of {count} question strings."
+    )
+    questions = router.chat_json("role_questions", [{"role": "user", "content": prompt}])
+    if not isinstance(questions, list):
+        raise LLMError("Unexpected format from OpenAI. No question returned.")
+    return questions
+
+@st.cache_resource
+def get_role_question_bank():
+    return RoleQuestionBank(
+        generate_role_questions,
+        get_router().route("role_questions").model,
+        set_size=int(st.secrets.get("ROLE_QUESTION_SET_SIZE", 10))
     )
+
+def generate_role_question(title, description, responsibilities, fresh=False):
+    # Served from a shared ranked set per job description; only the first click
+    # (or one after the set is used up) waits on OpenAI.
+    cursor = st.session_state.setdefault("role_question_cursor", {})
     try:
-        res = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return res.choices[0].message.content.strip()
-    except Exception as e:
+        return get_role_question_bank().next(title, description, responsibilities, cursor, fresh=fresh)
+    except LLMError as e:
         st.error(f"OpenAI error: {e}")
         return ""
 
+def fetch_gk_questions(covered, count):
+    # Called from the question pool's background thread, so it must not touch st.*.
+    question_prompt = (
+        f"Ask me {count} insightful, unique questions that help you deeply understand my professional background, "
+        "character, motivations, challenges, values, or ambitions. "
+        + (f"I've already answered {covered}. Explore different topics. " if covered else "")
+        + f"Return only a JSON list of {count} questions, like this: [\"First question\", \"Second question\"]"
+    )
+    question_list = router.chat_json("gk_questions", [{"role": "user", "content": question_prompt}])
+    if not isinstance(question_list, list):
+        raise LLMError("Unexpected format from OpenAI. No question returned.")
+    return [str(q) for q in question_list if str(q).strip()]
+
 def save_to_pdf(question, answer):
+    from fpdf import FPDF
+
     pdf = FPDF()
     pdf.add_page()
     pdf.set_font("Arial", size=12)
@@ -374,10 +623,20 @@ def save_to_pdf(question, answer):
     pdf.output(filename)
     return filename
 
-# ------------------ STATE INIT ------------------
-if "profiles" not in st.session_state:
-    st.session_state.profiles = load_profiles()
+def save_answers_to_pdf(results):
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    for number, result in enumerate(results, start=1):
+        answer = result["answer"] or f"(No answer: {result['error']})"
+        pdf.multi_cell(0, 10, f"{number}. Question: {result['question']}\n\nAnswer: {answer}\n")
+    filename = f"interview_answers_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    pdf.output(filename)
+    return filename
 
+# ------------------ STATE INIT ------------------
 username = st.session_state.username
 all_profiles = st.session_state.profiles
 
@@ -386,44 +645,30 @@ if username not in all_profiles:
     name = st.text_input("Full Name *", "")
     uploaded_file = st.file_uploader("Optional: Upload your CV (PDF or DOCX)", type=["pdf", "docx"])
     if st.button("Create Profile") and name.strip():
-        profile_data = {
-            "name": name.strip(),
-            "title": "",
-            "location": "",
-            "experience": [],
-            "skills": [],
-            "softSkills": [],
-            "learning": [],
-            "certifications": [],
-            "goals": "",
-            "cvText": ""
-        }
+        new_record = new_profile_record(name.strip())
+        profile_data = new_record["profile"]
         if uploaded_file:
-            cv_text = extract_cv_text(uploaded_file)
-            if cv_text:
-                profile_data["cvText"] = cv_text
-                filled = autofill_profile_from_cv(cv_text)
-                for key in ["name", "title", "location", "goals"]:
-                    profile_data[key] = filled.get(key, profile_data.get(key, ""))
-                for key in ["skills", "softSkills", "learning", "certifications"]:
-                    value = filled.get(key, "")
-                    if isinstance(value, list):
-                        profile_data[key] = [s.strip() for s in value]
-                    elif isinstance(value, str):
-                        profile_data[key] = [s.strip() for s in value.split(",")]
-                    else:
-                        profile_data[key] = []
-                profile_data["experience"] = filled.get("experience", [])
-        all_profiles[username] = {"profile": profile_data, "advanced": []}
-        save_profiles(all_profiles)
+            digest = file_digest(uploaded_file.getvalue())
+            cv_text, filled = ingest_cv(uploaded_file, digest)
+            if cv_text and filled:
+                externalize_cv(new_record, get_blob_store(), cv_text)
+                apply_cv_fields(profile_data, filled)
+                new_record["cvHash"] = digest
+        all_profiles[username] = new_record
+        save_profiles(all_profiles, [username])
         st.session_state.profiles = all_profiles
-        st.rerun()
-    st.stop()
+        rerun_script()
+    stop_script()
 
 user_profile = all_profiles[username]
 profile = user_profile["profile"]
 advanced_qna = user_profile["advanced"]
 
+# Records saved before the blob store existed still carry their CV inline.
+if profile.get("cvText") and get_blob_store() is not None:
+    externalize_cv(user_profile, get_blob_store())
+    save_profiles(all_profiles, [username])
+
 # ------------------ PROFILE EDIT ------------------
 with st.expander("📝 Edit Profile"):
     profile["name"] = st.text_input("Name", profile["name"])
@@ -439,39 +684,76 @@ with st.expander("📝 Edit Profile"):
     profile["certifications"] = st.text_area("Certifications", ", ".join(str(item).strip() for item in profile["certifications"] if str(item).strip())).split(", ")
     profile["goals"] = st.text_area("Career Goals", profile["goals"])
     if st.button("💾 Save Profile"):
-        save_profiles(all_profiles)
+        save_profiles(all_profiles, [username])
         st.success("Profile saved.")
 
 # ------------------ CV REUPLOAD ------------------
 with st.expander("📄 Upload or Replace CV"):
-    if profile.get("cvText"):
+    if user_profile.get("cvRef") or profile.get("cvText"):
         st.markdown("✅ A CV is already uploaded and stored for this profile.")
     uploaded_file = st.file_uploader("Upload your CV (PDF or DOCX)", type=["pdf", "docx"])
     if uploaded_file:
-        cv_text = extract_cv_text(uploaded_file)
-        if cv_text:
-            profile["cvText"] = cv_text
-            filled = autofill_profile_from_cv(cv_text)
-            for key in ["name", "title", "location", "goals"]:
-                profile[key] = filled.get(key, profile.get(key, ""))
-            for key in ["skills", "softSkills", "learning", "certifications"]:
-                value = filled.get(key, "")
-                if isinstance(value, list):
-                    profile[key] = [s.strip() for s in value]
-                elif isinstance(value, str):
-                    profile[key] = [s.strip() for s in value.split(",")]
-                else:
-                    profile[key] = []
-            profile["experience"] = filled.get("experience", [])
-            save_profiles(all_profiles)
-            st.success("CV uploaded and profile updated.")
+        # The uploader keeps its file across reruns, so apply each file only once.
+        digest = file_digest(uploaded_file.getvalue())
+        if user_profile.get("cvHash") == digest:
+            st.caption("This CV has already been applied to your profile.")
+        elif st.session_state.get("cv_failed_digest") == digest and not st.button("🔁 Retry CV analysis"):
+            # Don't call OpenAI again on every rerun while the failed file stays in the uploader.
+            st.caption("CV analysis failed for this file; your profile was left unchanged.")
         else:
-            st.error("Could not extract text from this file.")
+            st.session_state.pop("cv_failed_digest", None)
+            cv_text, filled = ingest_cv(uploaded_file, digest)
+            if cv_text and filled:
+                externalize_cv(user_profile, get_blob_store(), cv_text)
+                apply_cv_fields(profile, filled)
+                user_profile["cvHash"] = digest
+                save_profiles(all_profiles, [username])
+                st.success("CV uploaded and profile updated.")
+            elif cv_text:
+                # Nothing is applied or recorded, so the same file can be retried.
+                st.session_state.cv_failed_digest = digest
+                st.warning("Your profile was left unchanged; retry once the AI service is back.")
+            else:
+                st.error("Could not extract text from this file.")
+    if all_profiles.get(username, {}).get("is_admin") or all_profiles.get(username, {}).get("super_admin"):
+        cv_cache = get_cv_cache()
+        st.caption(
+            f"CV ingestion: {cv_cache.stats['extract_calls']} extractions, "
+            f"{cv_cache.stats['autofill_calls']} autofill calls, {cv_cache.repeat_calls()} repeat calls"
+        )
+        extraction = st.session_state.get("last_cv_extraction")
+        if extraction:
+            st.caption(
+                f"Last extraction: {extraction['pages_done']}/{extraction['pages_total']} pages in "
+                f"{extraction['elapsed']}s (slowest page {extraction['slowest_page']}: {extraction['slowest_page_seconds']}s)"
+            )
 
-          # ------------------ ADVANCED Q&A ------------------
+# ------------------ ADVANCED Q&A ------------------
 st.markdown("---")
 st.subheader("🧠 Get to Know Me")
 
+def gk_capacity():
+    return 50 - len(advanced_qna) - len(st.session_state.get("gk_answers", []))
+
+def gk_next_question():
+    # Served from the prefetched pool; only blocks if the pool is still empty.
+    pool = st.session_state.gk_pool
+    pool.set_capacity(gk_capacity())
+    if gk_capacity() <= 0:
+        st.session_state.gk_questions = []
+        return
+    try:
+        st.session_state.gk_questions = [pool.next()]
+    except Exception as e:
+        st.error(f"OpenAI error: {e}")
+        stop_script()
+
+def gk_finish():
+    st.session_state.gk_pool.stop()
+    st.session_state.gk_mode = False
+    advanced_qna.extend(st.session_state.gk_answers)
+    save_profiles(all_profiles, [username])
+
 if len(advanced_qna) >= 50:
     st.warning("You’ve reached the 50-question limit. Please delete some before continuing.")
 else:
@@ -479,22 +761,13 @@ else:
         st.session_state.gk_mode = True
         st.session_state.gk_index = 0
         st.session_state.gk_answers = []
-        question_prompt = (
-            "Ask me one highly personal, unique question that helps you deeply understand my character, motivations, challenges, values, or ambitions."
-            " Return only a JSON list with one question, like this: [\"Your question here\"]."
-            " Avoid repeating previous questions or rephrasing the same idea."
+        st.session_state.gk_pool = QuestionPool(
+            fetch_gk_questions,
+            asked=[item["q"] for item in advanced_qna],
+            capacity=gk_capacity(),
+            batch_size=int(st.secrets.get("GK_BATCH_SIZE", 5))
         )
-        try:
-            res = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": question_prompt}]
-            )
-            question_list = json.loads(res.choices[0].message.content)
-            st.session_state.gk_questions = [question_list[0]]
-            st.session_state.gk_index = 0
-        except Exception as e:
-            st.error(f"OpenAI error: {e}")
-            st.stop()
+        gk_next_question()
 
 if st.session_state.get("gk_mode", False):
     if len(st.session_state.gk_questions) > 0:
@@ -504,86 +777,67 @@ if st.session_state.get("gk_mode", False):
         col1, col2, col3 = st.columns([1, 1, 1], gap="small")
         if col1.button("✅ Submit Answer", key="submit_answer"):
             st.session_state.gk_answers.append({"q": current_q, "a": user_input})
-            question_prompt = (
-                "Ask me one insightful, unique question about my professional background that hasn't been asked yet. "
-                "Avoid rephrasing or repeating any of the following questions I've already answered: "
-                f"{[q['q'] for q in st.session_state.gk_answers]}. "
-                "Return only a JSON list with one question, like this: [\"Your question here\"]"
-            )
-            try:
-                res = openai.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": question_prompt}]
-                )
-                content = res.choices[0].message.content.strip()
-                try:
-                    question_list = json.loads(content)
-                    if isinstance(question_list, list) and question_list:
-                        st.session_state.gk_questions = [question_list[0]]
-                        st.rerun()
-                    else:
-                        st.error("Unexpected format from OpenAI. No question returned.")
-                        st.stop()
-                except Exception as e:
-                    st.error(f"OpenAI returned invalid JSON: {e}")
-                    st.stop()
-                
-            except Exception as e:
-                st.error(f"OpenAI error: {e}")
-                st.stop()
+            gk_next_question()
+            rerun_script()
         if col2.button("⏭️ Skip", key="skip_gk_btn"):
-            question_prompt = (
-                "Ask me one insightful, unique question about my professional background that hasn't been asked yet. "
-                "Avoid rephrasing or repeating any of the following questions I've already answered: "
-                f"{[q['q'] for q in st.session_state.gk_answers]}. "
-                "Return only a JSON list with one question, like this: [\"Your question here\"]"
-            )
-            try:
-                res = openai.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": question_prompt}]
-                )
-                content = res.choices[0].message.content.strip()
-                try:
-                    question_list = json.loads(content)
-                    if isinstance(question_list, list) and question_list:
-                        st.session_state.gk_questions = [question_list[0]]
-                        st.rerun()
-                    else:
-                        st.error("Unexpected format from OpenAI. No question returned.")
-                        st.stop()
-                except Exception as e:
-                    st.error(f"OpenAI returned invalid JSON: {e}")
-                    st.stop()
-            except Exception as e:
-                st.error(f"OpenAI error: {e}")
-                st.stop()
+            gk_next_question()
+            rerun_script()
 
         if col3.button("🚪 Exit", key="exit_gk"):
-            st.session_state.gk_mode = False
-            advanced_qna.extend(st.session_state.gk_answers)
-            save_profiles(all_profiles)
-            st.rerun()
-        st.stop()
+            gk_finish()
+            rerun_script()
+        # Keep the pool topped up while the user is typing.
+        st.session_state.gk_pool.top_up()
+        stop_script()
     else:
-        advanced_qna.extend(st.session_state.gk_answers)
-        save_profiles(all_profiles)
-        st.session_state.gk_mode = False
+        gk_finish()
         st.success("🎉 All questions saved.")
 
+QA_PER_PAGE = int(st.secrets.get("QA_PER_PAGE", 10))
+
 with st.expander("🔍 View & Manage Advanced Q&A"):
-    for i, item in enumerate(advanced_qna):
-        st.markdown(f"**Q{i+1}:** {item['q']}")
-        answer = st.text_area("Answer", item["a"], key=f"edit_a_{i}")
-        col1, col2 = st.columns(2)
-        if col1.button(f"💾 Save Q{i+1}", key=f"save_{i}"):
-            advanced_qna[i]["a"] = answer
-            save_profiles(all_profiles)
-            st.success(f"Saved Q{i+1}")
-        if col2.button(f"🗑️ Delete Q{i+1}", key=f"delete_{i}"):
-            del advanced_qna[i]
-            save_profiles(all_profiles)
-            st.rerun()
+    # One page of answers inside a single form: edits don't rerun the script, and
+    # submitting saves every changed answer and deletion as one change set.
+    if not advanced_qna:
+        st.info("No answers yet.")
+    else:
+        qa_pages = -(-len(advanced_qna) // QA_PER_PAGE)
+        qa_page = min(st.session_state.get("qa_page", 1), qa_pages)
+        start = (qa_page - 1) * QA_PER_PAGE
+        page_items = list(enumerate(advanced_qna))[start:start + QA_PER_PAGE]
+        col1, col2, col3 = st.columns([1, 4, 1])
+        if col1.button("◀", key="qa_prev", disabled=qa_page <= 1):
+            st.session_state.qa_page = qa_page - 1
+            rerun_script()
+        col2.caption(f"Showing {start + 1}–{start + len(page_items)} of {len(advanced_qna)} answers")
+        if col3.button("▶", key="qa_next", disabled=qa_page >= qa_pages):
+            st.session_state.qa_page = qa_page + 1
+            rerun_script()
+
+        # Widget keys change after every save so shifted items never show stale edits.
+        generation = st.session_state.setdefault("qa_form_generation", 0)
+        with st.form(f"qa_form_{generation}"):
+            edits = {}
+            deletions = []
+            for i, item in page_items:
+                st.markdown(f"**Q{i+1}:** {item['q']}")
+                edits[i] = st.text_area("Answer", item["a"], key=f"qa_{generation}_{i}")
+                if st.checkbox(f"🗑️ Delete Q{i+1}", key=f"qa_delete_{generation}_{i}"):
+                    deletions.append(i)
+            submitted_qa = st.form_submit_button("💾 Save changes")
+        if submitted_qa:
+            edited = [i for i, answer in edits.items() if answer != advanced_qna[i]["a"] and i not in deletions]
+            for i in edited:
+                advanced_qna[i]["a"] = edits[i]
+            for i in sorted(deletions, reverse=True):
+                del advanced_qna[i]
+            if edited or deletions:
+                save_profiles(all_profiles, [username])
+                st.session_state.qa_form_generation = generation + 1
+                st.session_state.qa_saved = f"Saved {len(edited)} edit(s) and {len(deletions)} deletion(s)."
+                rerun_script()
+        if st.session_state.get("qa_saved"):
+            st.success(st.session_state.pop("qa_saved"))
 
 # ------------------ INTERVIEW SIMULATION ------------------
 st.markdown("---")
@@ -603,35 +857,180 @@ with col_q:
     question_input = st.text_input("Enter your interview question", value=queued, key="question_input")
 with col_btn:
     if st.button("Generate Question"):
-        generated_q = generate_role_question(job_title_input, job_desc_input, job_resp_input)
+        generated_q = generate_role_question(
+            job_title_input, job_desc_input, job_resp_input, fresh=st.session_state.get("fresh_answer", False)
+        )
         if generated_q:
             st.session_state.queued_question = generated_q
-            st.rerun()
+            rerun_script()
 
+stream_answer = st.checkbox("⚡ Stream the answer as it is written", value=True, key="stream_answer")
+fresh_answer = st.checkbox("🔄 Ignore cached results and ask OpenAI again", value=False, key="fresh_answer")
 if st.button("Generate Answer") and question_input:
-    with st.spinner("Thinking..."):
-        answer = generate_interview_answer(question_input, user_profile)
-        st.markdown("---")
-        st.subheader("🧠 Question:")
-        st.write(question_input)
-        st.subheader("🗣️ Answer:")
-        st.write(answer)
-        st.markdown("---")
-        st.subheader("🔊 Read Aloud")
-        st.markdown(f"""
-            <script>
-            const utterance = new SpeechSynthesisUtterance({json.dumps(answer)});
-            const button = document.createElement('button');
-            button.textContent = '🔊 Play Answer';
-            button.style.padding = '0.5rem 1rem';
-            button.style.marginTop = '0.5rem';
-            button.onclick = () => window.speechSynthesis.speak(utterance);
-            document.currentScript.parentElement.appendChild(button);
-            </script>
-        """, unsafe_allow_html=True)
-        st.markdown("---")
-        st.subheader("🗣️ Answer:")
-        st.write(answer)
-        if st.button("📄 Export as PDF"):
-            filename = save_to_pdf(question_input, answer)
-            st.success(f"Saved as {filename}")
+    st.markdown("---")
+    st.subheader("🧠 Question:")
+    st.write(question_input)
+    st.subheader("🗣️ Answer:")
+    timing = {}
+    answer_task = "interview_answer_stream" if stream_answer else "interview_answer"
+    answer_key = interview_answer_key(question_input, user_profile, answer_task)
+    cached_answer = None if fresh_answer else get_answer_cache().get(answer_key)
+    try:
+        if cached_answer:
+            answer = cached_answer
+            timing["ttft"] = timing["total"] = 0.0
+            st.write(answer)
+        elif stream_answer:
+            answer = st.write_stream(stream_interview_answer(question_input, user_profile, timing))
+            get_answer_cache().put(answer_key, answer)
+        else:
+            started = time.perf_counter()
+            with st.spinner("Thinking..."):
+                answer = generate_interview_answer(question_input, user_profile, fresh=True)
+            timing["ttft"] = timing["total"] = time.perf_counter() - started
+            st.write(answer)
+    except LLMError as e:
+        st.error(f"OpenAI error: {e}")
+        stop_script()
+    st.session_state.setdefault("answer_timings", []).append(
+        {"question": question_input, "streamed": stream_answer, "cached": bool(cached_answer), **timing}
+    )
+    st.session_state.last_answer = {"question": question_input, "answer": answer}
+    if cached_answer:
+        st.caption("Served from the answer cache. Tick the box above to ask for a fresh answer.")
+    elif timing.get("ttft") is not None:
+        st.caption(f"First token after {timing['ttft']:.2f}s, complete after {timing['total']:.2f}s")
+    st.markdown("---")
+    st.subheader("🔊 Read Aloud")
+    st.markdown(f"""
+        <script>
+        const utterance = new SpeechSynthesisUtterance({json.dumps(answer)});
+        const button = document.createElement('button');
+        button.textContent = '🔊 Play Answer';
+        button.style.padding = '0.5rem 1rem';
+        button.style.marginTop = '0.5rem';
+        button.onclick = () => window.speechSynthesis.speak(utterance);
+        document.currentScript.parentElement.appendChild(button);
+        </script>
+    """, unsafe_allow_html=True)
+    st.markdown("---")
+
+# The last answer is kept in session state so the export survives the rerun
+# triggered by the export button itself.
+if st.session_state.get("last_answer"):
+    if st.button("📄 Export as PDF"):
+        last_answer = st.session_state.last_answer
+        filename = save_to_pdf(last_answer["question"], last_answer["answer"])
+        st.success(f"Saved as {filename}")
+
+# ------------------ BULK ANSWERS ------------------
+BULK_MAX_QUESTIONS = int(st.secrets.get("BULK_MAX_QUESTIONS", 50))
+
+def render_bulk_result(result):
+    st.markdown(f"**{result['index'] + 1}. {result['question']}**")
+    if result["error"]:
+        st.warning(f"OpenAI error: {result['error']}")
+    else:
+        st.write(result["answer"])
+
+with st.expander("📚 Bulk Answers"):
+    bulk_source = st.radio("Questions", ["Paste my own", "Generate for the job role"], horizontal=True, key="bulk_source")
+    if bulk_source == "Paste my own":
+        bulk_text = st.text_area(f"One question per line (up to {BULK_MAX_QUESTIONS})", key="bulk_questions")
+    else:
+        bulk_count = st.number_input("Number of questions", 1, BULK_MAX_QUESTIONS, min(20, BULK_MAX_QUESTIONS), key="bulk_count")
+        st.caption("Uses the Job Title, Description and Responsibilities above.")
+    if st.button("Generate All Answers", key="bulk_run"):
+        bulk_questions = []
+        if bulk_source == "Paste my own":
+            bulk_questions = parse_questions(bulk_text, BULK_MAX_QUESTIONS)
+        else:
+            try:
+                with st.spinner("Writing questions..."):
+                    generated = generate_role_questions(job_title_input, job_desc_input, job_resp_input, int(bulk_count))
+                bulk_questions = parse_questions("\n".join(str(q) for q in generated), BULK_MAX_QUESTIONS)
+            except LLMError as e:
+                st.error(f"OpenAI error: {e}")
+        if bulk_questions:
+            # Answers appear in the order they finish; the stored set is in question order.
+            progress = st.progress(0.0, text=f"0/{len(bulk_questions)} answered")
+            results_area = st.container()
+
+            def show_bulk_result(result, done, total):
+                progress.progress(done / total, text=f"{done}/{total} answered")
+                with results_area:
+                    render_bulk_result(result)
+
+            started = time.perf_counter()
+            results = generate_bulk_answers(bulk_questions, user_profile, show_bulk_result, fresh=fresh_answer)
+            st.session_state.bulk_answers = results
+            failed = sum(1 for r in results if r["error"])
+            st.caption(
+                f"{len(results)} answers in {time.perf_counter() - started:.1f}s"
+                + (f", {failed} failed" if failed else "")
+            )
+        elif bulk_source == "Paste my own":
+            st.warning("Add at least one question.")
+    elif st.session_state.get("bulk_answers"):
+        for result in st.session_state.bulk_answers:
+            render_bulk_result(result)
+    if st.session_state.get("bulk_answers"):
+        results = st.session_state.bulk_answers
+        col_md, col_csv, col_pdf = st.columns(3)
+        col_md.download_button("⬇️ Markdown", to_markdown(results), file_name="interview_answers.md", mime="text/markdown")
+        col_csv.download_button("⬇️ CSV", to_csv(results), file_name="interview_answers.csv", mime="text/csv")
+        if col_pdf.button("📄 Export as PDF", key="bulk_pdf"):
+            st.success(f"Saved as {save_answers_to_pdf(results)}")
+
+# ------------------ METRICS PANEL ------------------
+if METRICS.enabled and (all_profiles.get(username, {}).get("is_admin") or all_profiles.get(username, {}).get("super_admin")):
+    with st.sidebar:
+        with st.expander("📈 Metrics"):
+            snapshot = METRICS.snapshot()
+            rows = []
+            for name, op in sorted(snapshot["operations"].items()):
+                rows.append({
+                    "operation": name,
+                    "calls": op["count"],
+                    "errors": op["errors"],
+                    "p50 ms": round(op["p50"] * 1000, 1) if op["p50"] is not None else None,
+                    "p95 ms": round(op["p95"] * 1000, 1) if op["p95"] is not None else None,
+                    "KB in": round(op["bytes_in"] / 1024, 1),
+                    "KB out": round(op["bytes_out"] / 1024, 1),
+                    "tokens": op["prompt_tokens"] + op["completion_tokens"],
+                })
+            if rows:
+                st.dataframe(rows, hide_index=True)
+            else:
+                st.info("No measurements yet.")
+            answer_cache = get_answer_cache()
+            st.caption(
+                f"Answer cache: {answer_cache.hits} hits / {answer_cache.misses} misses. "
+                f"LLM gateway: {llm.stats['retries']} retries, {llm.stats['failures']} failures, "
+                f"breakers {', '.join(f'{m} {state}' for m, state in llm.breaker_states().items()) or 'closed'}."
+            )
+            scheduler_status = get_scheduler().status()
+            st.caption(
+                f"LLM scheduler: {scheduler_status['running']} running, {scheduler_status['queued']} queued "
+                f"from {scheduler_status['users_waiting']} user(s), {scheduler_status['tokens_available']} tokens left "
+                f"this minute; {scheduler_status['waited']} waits so far, peak depth {scheduler_status['peak_depth']}, "
+                f"{scheduler_status['rejected']} rejected, {scheduler_status['timeouts']} timed out."
+            )
+            route_rows = router.report()
+            if route_rows:
+                st.dataframe(route_rows, hide_index=True)
+            save_queue = get_save_queue()
+            st.caption(
+                f"Profile writes: {save_queue.submits} edits -> {save_queue.writes} writes, "
+                f"{snapshot['counters'].get('write_conflicts', 0)} conflicts, "
+                f"{snapshot['counters'].get('write_conflict_retries', 0)} retries."
+            )
+            if snapshot["counters"]:
+                st.dataframe(
+                    [{"counter": name, "value": value} for name, value in sorted(snapshot["counters"].items())],
+                    hide_index=True
+                )
+            st.download_button("⬇️ JSON snapshot", METRICS.to_json(), file_name="metrics.json", mime="application/json")
+            st.download_button("⬇️ Prometheus text", METRICS.prometheus(), file_name="metrics.prom", mime="text/plain")
+
+record_rerun()
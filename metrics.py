@@ -0,0 +1,198 @@
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_user = contextvars.ContextVar("metrics_user", default=None)
+
+
+def set_user(username):
+    _current_user.set(username or None)
+
+
+def current_user():
+    return _current_user.get()
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Operation:
+    def __init__(self, reservoir):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=reservoir)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **fields):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, registry, operation, user, fields):
+        self.registry = registry
+        self.operation = operation
+        self.user = user
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(
+            self.operation, time.perf_counter() - self.started, user=self.user,
+            error=exc_type is not None, **self.fields
+        )
+        return False
+
+    def add(self, **fields):
+        for key, value in fields.items():
+            self.fields[key] = self.fields.get(key, 0) + (value or 0)
+
+
+# ------------------ REGISTRY ------------------
+class Metrics:
+    # Latency histograms, call counts, payload bytes and token usage per operation
+    # and per user. When disabled every entry point returns immediately.
+    def __init__(self, enabled=True, reservoir=512):
+        self.enabled = enabled
+        self.reservoir = reservoir
+        self.started_at = time.time()
+        self._ops = {}
+        self._users = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def timer(self, operation, user=None, **fields):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, operation, user, dict(fields))
+
+    def observe(self, operation, seconds, user=None, error=False, bytes_in=0, bytes_out=0,
+                prompt_tokens=0, completion_tokens=0):
+        if not self.enabled:
+            return
+        user = user or _current_user.get()
+        with self._lock:
+            op = self._ops.get(operation)
+            if op is None:
+                op = self._ops[operation] = _Operation(self.reservoir)
+            op.count += 1
+            op.errors += 1 if error else 0
+            op.total += seconds
+            op.recent.append(seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    op.buckets[i] += 1
+                    break
+            op.bytes_in += bytes_in
+            op.bytes_out += bytes_out
+            op.prompt_tokens += prompt_tokens
+            op.completion_tokens += completion_tokens
+            if user:
+                stats = self._users.setdefault(user, {}).setdefault(
+                    operation, {"count": 0, "seconds": 0.0, "tokens": 0}
+                )
+                stats["count"] += 1
+                stats["seconds"] += seconds
+                stats["tokens"] += prompt_tokens + completion_tokens
+
+    def incr(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        # Point-in-time value such as a queue depth; the last write wins.
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            operations = {}
+            for name, op in self._ops.items():
+                recent = list(op.recent)
+                operations[name] = {
+                    "count": op.count,
+                    "errors": op.errors,
+                    "mean": op.total / op.count if op.count else None,
+                    "p50": percentile(recent, 0.50),
+                    "p95": percentile(recent, 0.95),
+                    "p99": percentile(recent, 0.99),
+                    "bytes_in": op.bytes_in,
+                    "bytes_out": op.bytes_out,
+                    "prompt_tokens": op.prompt_tokens,
+                    "completion_tokens": op.completion_tokens,
+                }
+            return {
+                "enabled": self.enabled,
+                "uptime": time.time() - self.started_at,
+                "operations": operations,
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "users": json.loads(json.dumps(self._users)),
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def prometheus(self, prefix="coach"):
+        lines = []
+        with self._lock:
+            for name, op in sorted(self._ops.items()):
+                label = f'operation="{name}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, op.buckets):
+                    cumulative += count
+                    lines.append(f'{prefix}_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_latency_seconds_bucket{{{label},le="+Inf"}} {op.count}')
+                lines.append(f"{prefix}_latency_seconds_sum{{{label}}} {op.total}")
+                lines.append(f"{prefix}_latency_seconds_count{{{label}}} {op.count}")
+                lines.append(f"{prefix}_errors_total{{{label}}} {op.errors}")
+                lines.append(f'{prefix}_payload_bytes_total{{{label},direction="in"}} {op.bytes_in}')
+                lines.append(f'{prefix}_payload_bytes_total{{{label},direction="out"}} {op.bytes_out}')
+                lines.append(f'{prefix}_tokens_total{{{label},kind="prompt"}} {op.prompt_tokens}')
+                lines.append(f'{prefix}_tokens_total{{{label},kind="completion"}} {op.completion_tokens}')
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"{prefix}_{name} {value}")
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
+            self._users.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+METRICS = Metrics()
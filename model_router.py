@@ -0,0 +1,252 @@
+import json
+import re
+import threading
+import time
+
+from llm import LLMError
+from llm_scheduler import AdmissionError
+from metrics import METRICS
+
+# USD per 1K tokens (prompt, completion); used for cost estimates only.
+PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+}
+
+DEFAULT_ROUTES = {
+    "default": {"model": "gpt-3.5-turbo", "fallback": "gpt-4o-mini", "latency_budget": 30},
+    "cv_autofill": {
+        "model": "gpt-4o-mini", "fallback": "gpt-3.5-turbo", "max_tokens": 1200, "temperature": 0,
+        "latency_budget": 45,
+    },
+    "interview_answer": {
+        "model": "gpt-3.5-turbo", "fallback": "gpt-4o-mini", "max_tokens": 500, "temperature": 0.7,
+        "latency_budget": 20,
+    },
+    # For streams the budget is the wait for the first token.
+    "interview_answer_stream": {
+        "model": "gpt-3.5-turbo", "fallback": "gpt-4o-mini", "max_tokens": 500, "temperature": 0.7,
+        "latency_budget": 10,
+    },
+    "role_questions": {
+        "model": "gpt-3.5-turbo", "fallback": "gpt-4o-mini", "max_tokens": 600, "temperature": 0.8,
+        "latency_budget": 15,
+    },
+    "gk_questions": {
+        "model": "gpt-3.5-turbo", "fallback": "gpt-4o-mini", "max_tokens": 400, "temperature": 0.9,
+        "latency_budget": 15,
+    },
+}
+
+
+class Route:
+    def __init__(self, task, model, fallback=None, max_tokens=None, temperature=None, latency_budget=None):
+        self.task = task
+        self.model = model
+        self.fallback = fallback
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.latency_budget = latency_budget
+
+    def params(self):
+        params = {}
+        if self.max_tokens is not None:
+            params["max_tokens"] = int(self.max_tokens)
+        if self.temperature is not None:
+            params["temperature"] = float(self.temperature)
+        return params
+
+    def attempts(self):
+        # (model, timeout, retries): the primary gets the latency budget and no
+        # retries when a fallback exists; the fallback gets the gateway defaults.
+        if not self.fallback or self.fallback == self.model:
+            return [(self.model, self.latency_budget, None)]
+        return [(self.model, self.latency_budget, 0), (self.fallback, None, None)]
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, prices=PRICES):
+    prompt_price, completion_price = prices.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+# ------------------ ROUTER ------------------
+class ModelRouter:
+    # Picks model, max tokens, temperature and latency budget per task. A call that
+    # fails or runs out of budget on the primary model is retried once on the
+    # route's fallback. Latency, tokens and estimated cost are kept per task/model.
+    def __init__(self, gateway, routes=None, prices=None):
+        self.gateway = gateway
+        self.prices = dict(PRICES, **(prices or {}))
+        self.routes = {}
+        for task, config in DEFAULT_ROUTES.items():
+            self.routes[task] = Route(task, **config)
+        for task, config in (routes or {}).items():
+            base = dict(DEFAULT_ROUTES.get(task, DEFAULT_ROUTES["default"]))
+            base.update(config)
+            self.routes[task] = Route(task, **base)
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def route(self, task):
+        return self.routes.get(task) or Route(task, **DEFAULT_ROUTES["default"])
+
+    def _record(self, task, model, seconds, prompt_tokens=0, completion_tokens=0, failed=False,
+                fallback=False, over_budget=False):
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, self.prices)
+        with self._lock:
+            stats = self.stats.setdefault((task, model), {
+                "calls": 0, "failures": 0, "fallbacks": 0, "over_budget": 0, "seconds": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+            })
+            stats["calls"] += 1
+            stats["failures"] += 1 if failed else 0
+            stats["fallbacks"] += 1 if fallback else 0
+            stats["over_budget"] += 1 if over_budget else 0
+            stats["seconds"] += seconds
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cost"] += cost
+        METRICS.observe(f"route.{task}.{model}", seconds, error=failed,
+                        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        # Counter names end up as Prometheus metric names, so no dots.
+        if fallback:
+            METRICS.incr(f"route_fallbacks_{_metric_name(task)}")
+        if over_budget:
+            METRICS.incr(f"route_over_budget_{_metric_name(task)}")
+
+    def _call(self, task, run):
+        route = self.route(task)
+        attempts = route.attempts()
+        for i, (model, timeout, retries) in enumerate(attempts):
+            started = time.perf_counter()
+            try:
+                content, usage = run(route, model, timeout, retries)
+            except AdmissionError:
+                # Rejected before reaching OpenAI; another model wouldn't help.
+                raise
+            except LLMError:
+                elapsed = time.perf_counter() - started
+                last = i == len(attempts) - 1
+                over = timeout is not None and elapsed >= timeout
+                self._record(task, model, elapsed, failed=True, fallback=not last, over_budget=over)
+                if last:
+                    raise
+                continue
+            elapsed = time.perf_counter() - started
+            over = route.latency_budget is not None and elapsed > route.latency_budget
+            self._record(task, model, elapsed, *usage, over_budget=over)
+            return content
+
+    def _request(self, route, timeout, retries):
+        params = route.params()
+        if timeout is not None:
+            params["timeout"] = float(timeout)
+        if retries is not None:
+            params["retries"] = retries
+        return params
+
+    def chat(self, task, messages, **params):
+        def run(route, model, timeout, retries):
+            response = self.gateway.create(
+                op=task, model=model, messages=messages, **self._request(route, timeout, retries), **params
+            )
+            return response.choices[0].message.content or "", _usage(response)
+        return self._call(task, run)
+
+    async def achat(self, task, messages, **params):
+        route = self.route(task)
+        attempts = route.attempts()
+        for i, (model, timeout, retries) in enumerate(attempts):
+            started = time.perf_counter()
+            try:
+                response = await self.gateway.acreate(
+                    op=task, model=model, messages=messages, **self._request(route, timeout, retries), **params
+                )
+            except AdmissionError:
+                raise
+            except LLMError:
+                elapsed = time.perf_counter() - started
+                last = i == len(attempts) - 1
+                self._record(task, model, elapsed, failed=True, fallback=not last,
+                             over_budget=timeout is not None and elapsed >= timeout)
+                if last:
+                    raise
+                continue
+            elapsed = time.perf_counter() - started
+            self._record(task, model, elapsed, *_usage(response),
+                         over_budget=route.latency_budget is not None and elapsed > route.latency_budget)
+            return response.choices[0].message.content or ""
+
+    def chat_json(self, task, messages, **params):
+        # Invalid JSON counts as a failure, so it also falls back.
+        def run(route, model, timeout, retries):
+            response = self.gateway.create(
+                op=task, model=model, messages=messages, **self._request(route, timeout, retries), **params
+            )
+            content = (response.choices[0].message.content or "").strip()
+            try:
+                return json.loads(content), _usage(response)
+            except ValueError as e:
+                raise LLMError(f"OpenAI returned invalid JSON: {e}") from e
+        return self._call(task, run)
+
+    def stream(self, task, messages, **params):
+        # Falls back only if the primary fails before its first token; the budget
+        # applies to the wait for that token.
+        route = self.route(task)
+        attempts = route.attempts()
+        for i, (model, timeout, retries) in enumerate(attempts):
+            started = time.perf_counter()
+            usage = {}
+            first_token = None
+            try:
+                for token in self.gateway.stream(
+                    messages, model, op=task, usage=usage, **self._request(route, timeout, retries), **params
+                ):
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    yield token
+            except AdmissionError:
+                raise
+            except LLMError:
+                elapsed = time.perf_counter() - started
+                last = i == len(attempts) - 1 or first_token is not None
+                self._record(task, model, elapsed, failed=True, fallback=not last,
+                             over_budget=timeout is not None and first_token is None and elapsed >= timeout)
+                if last:
+                    raise
+                continue
+            over = route.latency_budget is not None and first_token is not None and first_token > route.latency_budget
+            self._record(task, model, time.perf_counter() - started,
+                         usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), over_budget=over)
+            return
+
+    def report(self):
+        rows = []
+        with self._lock:
+            for (task, model), stats in sorted(self.stats.items()):
+                rows.append({
+                    "task": task,
+                    "model": model,
+                    "calls": stats["calls"],
+                    "failures": stats["failures"],
+                    "fallbacks": stats["fallbacks"],
+                    "over budget": stats["over_budget"],
+                    "avg s": round(stats["seconds"] / stats["calls"], 2),
+                    "tokens": stats["prompt_tokens"] + stats["completion_tokens"],
+                    "cost $": round(stats["cost"], 4),
+                })
+        return rows
+
+
+def _usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def _metric_name(task):
+    # Task names come from MODEL_ROUTES config and may hold any character.
+    return re.sub(r"[^a-zA-Z0-9_]", "_", task)
@@ -0,0 +1,106 @@
+import contextvars
+import threading
+from collections import deque
+
+from similarity import QuestionIndex
+
+
+# ------------------ QUESTION POOL ------------------
+class QuestionPool:
+    # Keeps a few "Get to Know Me" questions ready. `fetch_batch(covered, count)`
+    # returns a list of new questions and runs on a background thread, so the
+    # next question is usually waiting before the user submits their answer.
+    # `covered` is a short topic summary of everything already asked; candidates
+    # too similar to an earlier question are dropped and the rest of the batch
+    # (which over-asks by `spare`) fills the gap.
+    def __init__(self, fetch_batch, asked=(), capacity=50, batch_size=5, low_water=2, spare=3, threshold=0.5):
+        self.fetch_batch = fetch_batch
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.spare = spare
+        self.capacity = capacity
+        self.fetches = 0
+        self.rejected = 0
+        self.index = QuestionIndex(asked, threshold=threshold)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._fetching = False
+        self._stopped = False
+        self._error = None
+
+    def set_capacity(self, capacity):
+        # Never hold more questions than the user can still save.
+        with self._cond:
+            self.capacity = max(0, capacity)
+            while len(self._queue) > self.capacity:
+                self._queue.pop()
+
+    def top_up(self):
+        with self._cond:
+            wanted = min(self.batch_size, self.capacity - len(self._queue))
+            if self._stopped or self._fetching or len(self._queue) >= self.low_water or wanted <= 0:
+                return
+            self._fetching = True
+            covered = self.index.summary()
+        # The fetch runs in a copy of the caller's context so it is attributed to
+        # the same user.
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(self._fetch, covered, wanted + self.spare),
+            name="gk-question-pool", daemon=True
+        ).start()
+
+    def _fetch(self, covered, count):
+        try:
+            questions, error = self.fetch_batch(covered, count), None
+        except Exception as e:
+            questions, error = [], e
+        with self._cond:
+            self._fetching = False
+            self.fetches += 1
+            if self._stopped:
+                return
+            for question in questions:
+                question = str(question).strip()
+                if not question or len(self._queue) >= self.capacity:
+                    continue
+                # Queued questions join the index too, so one batch can't repeat itself.
+                if self.index.is_duplicate(question):
+                    self.rejected += 1
+                    continue
+                self._queue.append(question)
+                self.index.add(question)
+            self._error = error
+            self._cond.notify_all()
+
+    def next(self, timeout=60, attempts=3):
+        # A batch can come back entirely made of near-duplicates, so ask again a
+        # couple of times before giving up.
+        for _ in range(attempts):
+            self.top_up()
+            with self._cond:
+                while not self._queue and self._fetching and not self._stopped:
+                    if not self._cond.wait(timeout):
+                        raise TimeoutError("Timed out waiting for the next question.")
+                if self._queue:
+                    break
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                if self._stopped or self.capacity <= 0:
+                    break
+        with self._cond:
+            if not self._queue:
+                raise ValueError("No new question was returned.")
+            question = self._queue.popleft()
+        self.top_up()
+        return question
+
+    def ready(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._queue.clear()
+            self._cond.notify_all()
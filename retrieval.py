@@ -0,0 +1,133 @@
+import hashlib
+import math
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "do", "for", "from", "have",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "this",
+    "to", "was", "we", "what", "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+
+def tokenize(text):
+    return [t.rstrip(".") for t in TOKEN_RE.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    # Rough OpenAI-style estimate (~4 characters per token); good enough for budgeting.
+    return max(1, len(text) // 4)
+
+
+# ------------------ DOCUMENTS ------------------
+def chunk_cv(cv_text, max_words=80):
+    # Packs consecutive non-empty lines into chunks of at most `max_words` words so
+    # a section heading usually stays with the lines under it.
+    chunks, current, count = [], [], 0
+    for line in str(cv_text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        words = len(line.split())
+        if current and count + words > max_words:
+            chunks.append("\n".join(current))
+            current, count = [], 0
+        current.append(line)
+        count += words
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def profile_documents(profile_bundle):
+    profile = profile_bundle.get("profile", {})
+    docs = [("cv", chunk) for chunk in chunk_cv(profile.get("cvText", ""))]
+    for item in profile_bundle.get("advanced", []):
+        if item.get("a"):
+            docs.append(("qa", f"Q: {item.get('q', '')}\nA: {item['a']}"))
+    return docs
+
+
+# ------------------ BM25 INDEX ------------------
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs = {}
+        self._df = Counter()
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def sync(self, documents):
+        # Incremental rebuild: only documents whose text changed are re-tokenized.
+        wanted = {}
+        for source, text in documents:
+            doc_id = hashlib.sha1(f"{source}\0{text}".encode("utf-8")).hexdigest()
+            wanted[doc_id] = (source, text)
+        removed = [doc_id for doc_id in self._docs if doc_id not in wanted]
+        for doc_id in removed:
+            _, _, tf, length = self._docs.pop(doc_id)
+            self._df.subtract(tf.keys())
+            self._total_len -= length
+        self._df += Counter()
+        added = 0
+        for doc_id, (source, text) in wanted.items():
+            if doc_id in self._docs:
+                continue
+            tf = Counter(tokenize(text))
+            length = sum(tf.values())
+            self._docs[doc_id] = (source, text, tf, length)
+            self._df.update(tf.keys())
+            self._total_len += length
+            added += 1
+        return added, len(removed)
+
+    def search(self, query, top_k=6, token_budget=800):
+        terms = set(tokenize(query))
+        if not terms or not self._docs:
+            return []
+        n = len(self._docs)
+        avg_len = self._total_len / n if n else 0
+        scored = []
+        for source, text, tf, length in self._docs.values():
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                idf = math.log(1 + (n - self._df[term] + 0.5) / (self._df[term] + 0.5))
+                norm = freq + self.k1 * (1 - self.b + self.b * length / (avg_len or 1))
+                score += idf * freq * (self.k1 + 1) / norm
+            if score > 0:
+                scored.append((score, source, text))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        results, used = [], 0
+        for score, source, text in scored:
+            if len(results) >= top_k:
+                break
+            cost = estimate_tokens(text)
+            if used + cost > token_budget:
+                continue
+            results.append({"source": source, "text": text, "score": score})
+            used += cost
+        return results
+
+
+class ProfileIndex(BM25Index):
+    # Skips even the document diff when the CV text and Q&A are unchanged.
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._fingerprint = None
+
+    def update(self, profile_bundle):
+        profile = profile_bundle.get("profile", {})
+        fingerprint = hashlib.sha1(
+            repr((profile.get("cvText", ""), profile_bundle.get("advanced", []))).encode("utf-8")
+        ).hexdigest()
+        if fingerprint != self._fingerprint:
+            self.sync(profile_documents(profile_bundle))
+            self._fingerprint = fingerprint
+        return self
@@ -0,0 +1,50 @@
+import threading
+
+from answer_cache import AnswerCache, cache_key
+
+
+# ------------------ ROLE QUESTION BANK ------------------
+class RoleQuestionBank:
+    # One ranked set of questions per job title/description/responsibilities,
+    # shared by every session. `generate(title, description, responsibilities, count)`
+    # returns a list of questions; each session walks the set with its own cursor
+    # and only triggers a new generation once it has seen every question.
+    def __init__(self, generate, model, set_size=10, max_sets=128, ttl=7 * 24 * 3600, stripes=32):
+        self.generate = generate
+        self.model = model
+        self.set_size = set_size
+        self.cache = AnswerCache(max_entries=max_sets, ttl=ttl)
+        self.generated = 0
+        self.served = 0
+        # Striped locks: concurrent clicks on the same job description wait for one
+        # generation instead of each calling the model, without an unbounded lock map.
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def key(self, title, description, responsibilities):
+        return cache_key("role_questions", self.model, title, description, responsibilities)
+
+    def questions(self, title, description, responsibilities, fresh=False):
+        key = self.key(title, description, responsibilities)
+        with self._locks[hash(key) % len(self._locks)]:
+            return self.cache.get_or_compute(
+                key, lambda: self._generate(title, description, responsibilities), fresh=fresh
+            )
+
+    def _generate(self, title, description, responsibilities):
+        self.generated += 1
+        questions = self.generate(title, description, responsibilities, self.set_size)
+        return [str(q).strip() for q in questions if str(q).strip()]
+
+    def next(self, title, description, responsibilities, cursor, fresh=False):
+        # `cursor` is a per-session dict of set key -> next position.
+        key = self.key(title, description, responsibilities)
+        questions = self.questions(title, description, responsibilities, fresh=fresh)
+        position = 0 if fresh else cursor.get(key, 0)
+        if position >= len(questions):
+            questions = self.questions(title, description, responsibilities, fresh=True)
+            position = 0
+        if not questions:
+            return ""
+        cursor[key] = position + 1
+        self.served += 1
+        return questions[position]
@@ -0,0 +1,227 @@
+import copy
+import random
+import threading
+import time
+
+from metrics import METRICS
+from storage import ConflictError, rev_of
+
+DELETE = object()
+_UNSET = object()
+
+
+# ------------------ CHANGE SETS ------------------
+def diff_record(old, new, depth=2):
+    # Field-level change set: {path tuple: new value}. Lists and scalars are
+    # replaced whole; dicts are walked down to `depth` levels.
+    if not isinstance(old, dict) or not isinstance(new, dict) or depth == 0:
+        return {} if old == new else {(): copy.deepcopy(new)}
+    changes = {}
+    for key in new:
+        if key not in old:
+            changes[(key,)] = copy.deepcopy(new[key])
+            continue
+        for path, value in diff_record(old[key], new[key], depth - 1).items():
+            changes[(key,) + path] = value
+    for key in old:
+        if key not in new:
+            changes[(key,)] = DELETE
+    return changes
+
+
+def apply_changes(record, fields):
+    for path, value in fields.items():
+        target = record
+        for key in path[:-1]:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        if value is DELETE:
+            target.pop(path[-1], None)
+        else:
+            target[path[-1]] = copy.deepcopy(value)
+    return record
+
+
+class _PendingRecord:
+    def __init__(self):
+        self.replace = _UNSET
+        self.fields = {}
+
+    def merge(self, changes):
+        for path, value in changes.items():
+            if path == ():
+                self.replace = value
+                self.fields = {}
+            else:
+                self.fields = {
+                    p: v for p, v in self.fields.items() if p[:len(path)] != path
+                }
+                self.fields[path] = value
+
+    def absorb(self, newer):
+        if newer.replace is not _UNSET:
+            self.replace = newer.replace
+            self.fields = dict(newer.fields)
+        else:
+            self.merge(newer.fields)
+
+    def resolve(self, current):
+        # `current` is the latest stored record; field changes are replayed on
+        # top of it, so edits from other sessions to other fields survive.
+        if self.replace is DELETE:
+            if not self.fields:
+                return None
+            base = {}
+        elif self.replace is not _UNSET:
+            base = copy.deepcopy(self.replace)
+        else:
+            base = copy.deepcopy(current) or {}
+        if not self.fields:
+            return base
+        return apply_changes(base, self.fields)
+
+
+# ------------------ WRITE-BEHIND QUEUE ------------------
+class WriteBehindQueue:
+    # Coalesces bursts of edits into one backend write per debounce window.
+    # `max_delay` caps how long a steady stream of edits can postpone a write.
+    # Writes are compare-and-swap on each record's revision: on a conflict the
+    # pending field changes are replayed on the newer record and retried up to
+    # `conflict_retries` times before the edits are requeued.
+    def __init__(self, backend, debounce=1.0, max_delay=5.0, retry_delay=5.0, conflict_retries=3,
+                 conflict_backoff=0.05):
+        self.backend = backend
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.conflict_retries = conflict_retries
+        self.conflict_backoff = conflict_backoff
+        self._pending = {}
+        self._first_change = None
+        self._last_change = None
+        self._in_flight = set()
+        self._committed_at = {}
+        self._errors = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.writes = 0
+        self.submits = 0
+        self.conflicts = 0
+        self._worker = threading.Thread(target=self._run, name="profile-write-behind", daemon=True)
+        self._worker.start()
+
+    def submit(self, username, changes):
+        if not changes:
+            return
+        with self._cond:
+            self._pending.setdefault(username, _PendingRecord()).merge(changes)
+            now = time.monotonic()
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+            self.submits += 1
+            self._cond.notify_all()
+
+    def delete(self, username):
+        self.submit(username, {(): DELETE})
+
+    def status(self, username):
+        with self._cond:
+            return {
+                "pending": username in self._pending or username in self._in_flight,
+                "committed_at": self._committed_at.get(username),
+                "error": self._errors.get(username),
+            }
+
+    def is_pending(self, usernames):
+        with self._cond:
+            return any(u in self._pending or u in self._in_flight for u in usernames)
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._first_change = self._last_change = float("-inf") if self._pending else None
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                if not self._in_flight and all(u in self._errors for u in self._pending):
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        return flushed
+
+    def _due_in(self):
+        now = time.monotonic()
+        return max(0.0, min(self._last_change + self.debounce, self._first_change + self.max_delay) - now)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._pending or self._due_in() > 0):
+                    self._cond.wait(self._due_in() if self._pending else None)
+                if self._closed and not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                self._first_change = self._last_change = None
+                self._in_flight = set(batch)
+            failed = self._write(batch)
+            with self._cond:
+                self._in_flight = set()
+                if failed:
+                    # Keep the failed edits queued underneath anything submitted since.
+                    for username, pending in failed.items():
+                        newer = self._pending.get(username)
+                        if newer is not None:
+                            pending.absorb(newer)
+                        self._pending[username] = pending
+                    retry_at = time.monotonic() + self.retry_delay
+                    self._first_change = self._last_change = retry_at
+                self._cond.notify_all()
+                if failed and self._closed:
+                    return
+
+    def _save(self, batch):
+        for attempt in range(self.conflict_retries + 1):
+            # Base the change on the latest stored revision, not a cached copy.
+            self.backend.revalidate(force=True)
+            changes, expected = {}, {}
+            for username, pending in batch.items():
+                current = self.backend.load_user(username)
+                expected[username] = rev_of(current)
+                changes[username] = pending.resolve(current)
+            try:
+                self.backend.save_users(changes, expected=expected)
+                return
+            except ConflictError as e:
+                self.conflicts += 1
+                METRICS.incr("write_conflicts", len(e.usernames))
+                if attempt == self.conflict_retries:
+                    METRICS.incr("write_conflicts_exhausted")
+                    raise
+                METRICS.incr("write_conflict_retries")
+                time.sleep(random.uniform(0, self.conflict_backoff * (2 ** attempt)))
+
+    def _write(self, batch):
+        try:
+            self._save(batch)
+        except Exception as e:
+            with self._cond:
+                for username in batch:
+                    self._errors[username] = str(e)
+            return batch
+        now = time.time()
+        with self._cond:
+            self.writes += 1
+            for username in batch:
+                self._committed_at[username] = now
+                self._errors.pop(username, None)
+        return {}
@@ -0,0 +1,87 @@
+import math
+import re
+from collections import Counter
+
+from retrieval import STOPWORDS
+
+QUESTION_WORDS = {
+    "about", "ask", "can", "could", "describe", "did", "does", "ever", "example", "experience",
+    "feel", "give", "had", "has", "if", "into", "most", "one", "share", "some", "tell", "think",
+    "time", "us", "were", "would", "yourself", "any", "been", "being", "there", "their", "them",
+    "each", "get", "got", "make", "made", "more", "out", "really", "thing", "things", "through",
+    "very", "way",
+}
+WORD_RE = re.compile(r"[a-z][a-z'-]+")
+
+
+def _stem(word):
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def terms(text):
+    return [
+        _stem(w) for w in WORD_RE.findall(str(text).lower())
+        if w not in STOPWORDS and w not in QUESTION_WORDS
+    ]
+
+
+# ------------------ QUESTION INDEX ------------------
+class QuestionIndex:
+    # TF-IDF cosine over stemmed content words. Local and cheap enough to check
+    # every candidate question against everything the user has already seen.
+    def __init__(self, questions=(), threshold=0.5):
+        self.threshold = threshold
+        self._vectors = []
+        self._df = Counter()
+        self._topics = Counter()
+        self._originals = Counter()
+        for question in questions:
+            self.add(question)
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def _idf(self, term):
+        return math.log((1 + len(self._vectors)) / (1 + self._df[term])) + 1
+
+    def _vector(self, tf):
+        vec = {t: c * self._idf(t) for t, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {t: v / norm for t, v in vec.items()}
+
+    def add(self, question):
+        tf = Counter(terms(question))
+        self._vectors.append(tf)
+        self._df.update(tf.keys())
+        self._topics.update(tf.keys())
+        for word in WORD_RE.findall(str(question).lower()):
+            self._originals[(_stem(word), word)] += 1
+
+    def max_similarity(self, question):
+        tf = Counter(terms(question))
+        if not tf or not self._vectors:
+            return 0.0
+        candidate = self._vector(tf)
+        best = 0.0
+        for other in self._vectors:
+            if not candidate.keys() & other.keys():
+                continue
+            vec = self._vector(other)
+            best = max(best, sum(w * vec.get(t, 0.0) for t, w in candidate.items()))
+        return best
+
+    def is_duplicate(self, question):
+        return self.max_similarity(question) >= self.threshold
+
+    def summary(self, max_topics=15):
+        # Compressed stand-in for the full question list in prompts.
+        if not self._vectors:
+            return ""
+        words = []
+        for stem, _ in self._topics.most_common(max_topics):
+            spellings = [(count, word) for (s, word), count in self._originals.items() if s == stem]
+            words.append(max(spellings)[1] if spellings else stem)
+        return f"{len(self._vectors)} questions so far, covering: {', '.join(words)}"
@@ -0,0 +1,309 @@
+import copy
+import json
+import sqlite3
+import threading
+import time
+
+from metrics import METRICS
+
+PENDING_KEY = "pending_signups"
+REV_KEY = "_rev"
+
+
+class ConflictError(Exception):
+    # Raised by save_users when a record's revision no longer matches the one
+    # the caller based its change on.
+    def __init__(self, usernames):
+        super().__init__(f"Profiles changed concurrently: {', '.join(sorted(usernames))}")
+        self.usernames = usernames
+
+
+def rev_of(record):
+    if record is None:
+        return None
+    return record.get(REV_KEY, 0) if isinstance(record, dict) else 0
+
+
+def _stamp(record, rev):
+    if not isinstance(record, dict):
+        return record
+    record = dict(record)
+    record[REV_KEY] = rev
+    return record
+
+
+# ------------------ GIST BACKEND ------------------
+class GistBackend:
+    # Whole-document store: every user lives in one profiles.json file on a Gist,
+    # so writes always PATCH the full document. The last document seen is cached
+    # for the whole process: reads inside `cache_ttl` are served from memory and
+    # older copies are revalidated with If-None-Match, so an unchanged Gist costs
+    # a 304 instead of a full download.
+    def __init__(self, token, gist_id, filename="profiles.json", timeout=10, cache_ttl=30,
+                 api_url="https://api.github.com"):
+        self.url = f"{api_url.rstrip('/')}/gists/{gist_id}"
+        self.filename = filename
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+        self.version = 0
+        self.stats = {"hits": 0, "revalidated": 0, "fetched": 0}
+        self._session = None
+        self._doc = None
+        self._etag = None
+        self._revision = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _http(self):
+        # One pooled keep-alive session per backend; requests is imported lazily.
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update(self.headers)
+        return self._session
+
+    def _fresh(self):
+        return self._doc is not None and time.monotonic() - self._fetched_at < self.cache_ttl
+
+    def revalidate(self, force=False):
+        # Single-flight: concurrent sessions wait for one request instead of each fetching.
+        with self._fetch_lock:
+            with self._lock:
+                if not force and self._fresh():
+                    self.stats["hits"] += 1
+                    return
+                headers = {}
+                if self._etag and self._doc is not None:
+                    headers["If-None-Match"] = self._etag
+            with METRICS.timer("gist_get") as timer:
+                res = self._http().get(self.url, headers=headers, timeout=self.timeout)
+                timer.add(bytes_in=len(res.content))
+            if res.status_code == 304:
+                with self._lock:
+                    self._fetched_at = time.monotonic()
+                    self.stats["revalidated"] += 1
+                return
+            res.raise_for_status()
+            body = res.json()
+            doc = json.loads(body["files"][self.filename]["content"])
+            with self._lock:
+                self._doc = doc
+                self._etag = res.headers.get("ETag")
+                self._revision = _history(body, 0)
+                self._fetched_at = time.monotonic()
+                self.version += 1
+                self.stats["fetched"] += 1
+
+    def load_all(self):
+        self.revalidate()
+        with self._lock:
+            return copy.deepcopy(self._doc)
+
+    def load_user(self, username):
+        self.revalidate()
+        with self._lock:
+            return copy.deepcopy(self._doc.get(username))
+
+    def load_changed(self, known):
+        # `known` maps usernames to the revision the caller holds. Returns copies of
+        # only the records that are new or have another revision, and None for
+        # the ones that are gone; records without a revision are always returned.
+        self.revalidate()
+        with self._lock:
+            changed = {
+                username: copy.deepcopy(record) for username, record in self._doc.items()
+                if not isinstance(record, dict) or username not in known or rev_of(record) != known[username]
+            }
+            changed.update({username: None for username in known if username not in self._doc})
+        return changed
+
+    def save_all(self, profiles):
+        data = json.dumps({"files": {self.filename: {"content": json.dumps(profiles)}}})
+        with METRICS.timer("gist_patch", bytes_out=len(data)):
+            res = self._http().patch(self.url, data=data, timeout=self.timeout)
+        res.raise_for_status()
+        body = res.json()
+        # Write-through: our own write is the freshest copy, so no refetch is needed.
+        with self._lock:
+            self._doc = copy.deepcopy(profiles)
+            self._etag = res.headers.get("ETag")
+            self._revision = _history(body, 0)
+            self._fetched_at = time.monotonic()
+            self.version += 1
+        return body
+
+    def _load_revision(self, revision):
+        with METRICS.timer("gist_get_revision") as timer:
+            res = self._http().get(f"{self.url}/{revision}", timeout=self.timeout)
+            timer.add(bytes_in=len(res.content))
+        res.raise_for_status()
+        return json.loads(res.json()["files"][self.filename]["content"])
+
+    def save_users(self, changes, expected=None, repair_attempts=5):
+        # The Gist API has no conditional PATCH, so this is compare-and-swap
+        # against a forced revalidation (usually a 304) taken just before the
+        # write; `expected` maps usernames to the revision each change was based on.
+        # Another process can still PATCH between that check and ours, so the
+        # Gist history is checked afterwards and that write's changes are merged
+        # back in (see _repair).
+        with self._write_lock:
+            self.revalidate(force=True)
+            with self._lock:
+                base = dict(self._doc)
+                based_on = self._revision
+            if expected:
+                stale = [u for u, rev in expected.items() if rev_of(base.get(u)) != rev]
+                if stale:
+                    raise ConflictError(stale)
+            doc = dict(base)
+            for username, record in changes.items():
+                if record is None:
+                    doc.pop(username, None)
+                else:
+                    doc[username] = _stamp(record, (rev_of(doc.get(username)) or 0) + 1)
+            body = self.save_all(doc)
+            for _ in range(repair_attempts):
+                parent = _history(body, 1)
+                if not based_on or not parent or parent == based_on:
+                    break
+                METRICS.incr("gist_interleaved_writes")
+                base, doc, based_on, body = self._repair(base, doc, parent)
+            else:
+                METRICS.incr("gist_repair_exhausted")
+
+    def _repair(self, base, doc, parent):
+        # `parent` is the revision our PATCH replaced. Records in it with a newer
+        # revision than the copy we based our write on were changed by the
+        # interleaved writer: replay their field changes on top of ours and write
+        # the merged document again.
+        from save_queue import apply_changes, diff_record
+
+        theirs = self._load_revision(parent)
+        merged = dict(doc)
+        for username, record in theirs.items():
+            old = base.get(username)
+            if (rev_of(record) or 0) <= (rev_of(old) or 0):
+                continue
+            ours = merged.get(username)
+            if isinstance(ours, dict) and isinstance(old, dict):
+                record = apply_changes(copy.deepcopy(ours), diff_record(old, record))
+            merged[username] = _stamp(record, max(rev_of(record) or 0, rev_of(ours) or 0) + 1)
+        based_on = self._revision
+        body = self.save_all(merged)
+        return doc, merged, based_on, body
+
+
+def _history(body, index):
+    history = body.get("history") or []
+    return history[index].get("version") if len(history) > index else None
+
+
+# ------------------ SQLITE BACKEND ------------------
+class SQLiteBackend:
+    # Sharded store: one row per user, so reads and writes only touch the
+    # records that are asked for. Each row carries a revision that save_users
+    # checks and bumps inside one IMMEDIATE transaction, so compare-and-swap
+    # holds across processes sharing the file.
+    def __init__(self, path="profiles.db"):
+        self.path = path
+        self.version = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles "
+                "(username TEXT PRIMARY KEY, data TEXT NOT NULL, rev INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(profiles)")]
+            if "rev" not in columns:
+                self._conn.execute("ALTER TABLE profiles ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+
+    def load_all(self):
+        with METRICS.timer("sqlite_load_all"), self._lock:
+            rows = self._conn.execute("SELECT username, data, rev FROM profiles").fetchall()
+        return {username: _stamp(json.loads(data), rev) for username, data, rev in rows}
+
+    def load_changed(self, known):
+        # Same contract as GistBackend.load_changed; only the changed rows are read
+        # and decoded. Rows still at revision 0 may not be dicts, so they are
+        # always returned.
+        with METRICS.timer("sqlite_load_changed"), self._lock:
+            revs = dict(self._conn.execute("SELECT username, rev FROM profiles").fetchall())
+            wanted = [u for u, rev in revs.items() if not rev or u not in known or rev != known[u]]
+            rows = []
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                rows += self._conn.execute(
+                    f"SELECT username, data, rev FROM profiles WHERE username IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+        changed = {username: _stamp(json.loads(data), rev) for username, data, rev in rows}
+        changed.update({username: None for username in known if username not in revs})
+        return changed
+
+    def load_user(self, username):
+        with METRICS.timer("sqlite_load_user"), self._lock:
+            row = self._conn.execute(
+                "SELECT data, rev FROM profiles WHERE username = ?", (username,)
+            ).fetchone()
+        return _stamp(json.loads(row[0]), row[1]) if row else None
+
+    def save_all(self, profiles):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM profiles")
+            self._conn.executemany(
+                "INSERT INTO profiles (username, data, rev) VALUES (?, ?, ?)",
+                [(username, json.dumps(record), rev_of(record) or 0) for username, record in profiles.items()]
+            )
+            self.version += 1
+
+    def save_users(self, changes, expected=None):
+        with METRICS.timer("sqlite_save_users"), self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                revs = {}
+                for username in changes:
+                    row = self._conn.execute("SELECT rev FROM profiles WHERE username = ?", (username,)).fetchone()
+                    revs[username] = row[0] if row else None
+                if expected:
+                    stale = [u for u, rev in expected.items() if revs.get(u) != rev]
+                    if stale:
+                        raise ConflictError(stale)
+                for username, record in changes.items():
+                    if record is None:
+                        self._conn.execute("DELETE FROM profiles WHERE username = ?", (username,))
+                        continue
+                    # Only dict records can carry a revision (see rev_of).
+                    rev = (revs[username] or 0) + 1 if isinstance(record, dict) else 0
+                    data = {k: v for k, v in record.items() if k != REV_KEY} if isinstance(record, dict) else record
+                    self._conn.execute(
+                        "INSERT INTO profiles (username, data, rev) VALUES (?, ?, ?) "
+                        "ON CONFLICT(username) DO UPDATE SET data = excluded.data, rev = excluded.rev",
+                        (username, json.dumps(data), rev)
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self.version += 1
+
+    def revalidate(self, force=False):
+        pass
+
+
+BACKENDS = {
+    "gist": GistBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def create_backend(name, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown profile backend: {name}")
+    return BACKENDS[name](**options)
@@ -0,0 +1,29 @@
+from bench.fake_servers import FakeGistServer
+from blob_store import GistBlobStore
+
+
+def _store(server):
+    return GistBlobStore("test", "blobs", api_url=server.url, raw_url=server.url)
+
+
+def test_gist_get_fetches_only_the_requested_blob():
+    server = FakeGistServer(filename="readme.md").start()
+    try:
+        writer = _store(server)
+        refs = [writer.put(f"CV {i} " + "experience " * 2000) for i in range(5)]
+        reader = _store(server)
+        assert reader.get(refs[2]).startswith("CV 2 ")
+        assert server.stats["gets"] == 0
+        assert server.stats["raw_gets"] == 1
+        assert reader.get(refs[2]).startswith("CV 2 ")
+        assert server.stats["raw_gets"] == 1
+    finally:
+        server.stop()
+
+
+def test_gist_get_of_an_unknown_blob_is_none():
+    server = FakeGistServer(filename="readme.md").start()
+    try:
+        assert _store(server).get("sha256:" + "0" * 64) is None
+    finally:
+        server.stop()
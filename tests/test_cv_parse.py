@@ -0,0 +1,28 @@
+from cv_parse import autofill_cv, local_extract
+
+BODY = "\nSkills\nPython, SQL, Spark\nExperience\nData Engineer at Example Ltd"
+
+
+def test_title_line_is_not_taken_as_the_name():
+    profile, confidence = local_extract("CURRICULUM VITAE\nJane Doe\njane@example.com | 07700 900123" + BODY)
+    assert profile["name"] == "Jane Doe"
+    assert confidence["name"] >= 0.75
+
+
+def test_name_without_contact_details_is_left_for_the_llm():
+    for cv in ("RESUME\nJANE DOE" + BODY, "Résumé\nJane Doe" + BODY):
+        profile, confidence = local_extract(cv)
+        assert profile["name"] != "RESUME"
+        assert confidence["name"] < 0.75
+
+
+def test_autofill_asks_the_llm_for_an_untrusted_name():
+    asked = []
+
+    def extract_chunk(chunk, index, total, fields):
+        asked.append(fields)
+        return {"name": "Jane Doe"}
+
+    profile = autofill_cv("CURRICULUM VITAE" + BODY, extract_chunk)
+    assert profile["name"] == "Jane Doe"
+    assert any("name" in fields for fields in asked)
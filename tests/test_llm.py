@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from bench.fake_servers import FakeOpenAIServer, FaultProfile
+from llm import CircuitOpenError, LLMError, LLMGateway
+
+MESSAGES = [{"role": "user", "content": "Tell me about yourself"}]
+
+
+@pytest.fixture
+def server():
+    server = FakeOpenAIServer().start()
+    yield server
+    server.stop()
+
+
+def _gateway(server, **options):
+    return LLMGateway(api_key="test", base_url=server.url + "/v1", max_retries=0, **options)
+
+
+def _half_open_gateway(server):
+    gateway = _gateway(server, failure_threshold=1, reset_timeout=0.05)
+    gateway.breaker("fake-model").record_failure()
+    time.sleep(0.06)
+    return gateway
+
+
+def test_abandoned_trial_stream_lets_the_next_call_through(server):
+    gateway = _half_open_gateway(server)
+    stream = gateway.stream(MESSAGES, model="fake-model")
+    next(stream)
+    stream.close()
+    assert gateway.chat(MESSAGES, model="fake-model")
+    assert gateway.breaker("fake-model").state == "closed"
+
+
+def test_second_call_is_refused_while_the_trial_runs(server):
+    gateway = _half_open_gateway(server)
+    stream = gateway.stream(MESSAGES, model="fake-model")
+    next(stream)
+    with pytest.raises(CircuitOpenError):
+        gateway.chat(MESSAGES, model="fake-model")
+    stream.close()
+
+
+def test_failing_model_does_not_open_the_breaker_of_another():
+    server = FakeOpenAIServer(model_faults={"primary": FaultProfile(failure_rate=1.0, failure_statuses=(503,))}).start()
+    try:
+        gateway = _gateway(server, failure_threshold=2)
+        for _ in range(3):
+            with pytest.raises(LLMError):
+                gateway.chat(MESSAGES, model="primary")
+        assert gateway.breaker_states() == {"primary": "open"}
+        assert gateway.chat(MESSAGES, model="fallback")
+    finally:
+        server.stop()
+
+
+def test_client_errors_do_not_count_as_failures():
+    server = FakeOpenAIServer(model_faults={"bad": FaultProfile(failure_rate=1.0, failure_statuses=(400,))}).start()
+    try:
+        gateway = _gateway(server, failure_threshold=2)
+        for _ in range(3):
+            with pytest.raises(LLMError):
+                gateway.chat(MESSAGES, model="bad")
+        assert gateway.breaker("bad").state == "closed"
+    finally:
+        server.stop()
+
+
+def test_batch_run_closes_its_async_client(server):
+    from batch_answers import run_batch
+
+    gateway = _gateway(server)
+    clients = []
+
+    async def answer(question):
+        clients.append(gateway._async_client())
+        return await gateway.achat([{"role": "user", "content": question}], model="fake-model")
+
+    results = run_batch(["One?", "Two?"], answer, on_close=gateway.aclose)
+    assert all(r["answer"] for r in results)
+    assert clients[0].is_closed()
+    assert not gateway._async_clients
@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import FairScheduler, QueueTimeoutError, fan_out, set_wait_notifier
+from metrics import set_user
+
+PARAMS = {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}
+
+
+class Stop(Exception):
+    # Stands in for Streamlit's StopException/RerunException.
+    pass
+
+
+def _raising_notifier(position, eta):
+    if position is not None:
+        raise Stop()
+
+
+def _assert_idle(scheduler):
+    status = scheduler.status()
+    assert status["running"] == 0
+    assert status["queued"] == 0
+
+
+def test_slot_waiter_whose_notifier_raises_leaves_no_ticket():
+    scheduler = FairScheduler(max_concurrent=1, max_wait=5, poll=0.01)
+    errors = []
+
+    def waiter():
+        set_user("bob")
+        set_wait_notifier(_raising_notifier)
+        try:
+            with scheduler.slot("chat", PARAMS):
+                pass
+        except Stop as e:
+            errors.append(e)
+
+    set_user("alice")
+    with scheduler.slot("chat", PARAMS):
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        thread.join(2)
+    assert errors
+    _assert_idle(scheduler)
+
+    with scheduler.slot("chat", PARAMS):
+        assert scheduler.status()["running"] == 1
+    _assert_idle(scheduler)
+
+
+def test_slot_timeout_leaves_no_ticket():
+    scheduler = FairScheduler(max_concurrent=1, max_wait=0.05, poll=0.01)
+
+    def waiter():
+        set_user("bob")
+        with pytest.raises(QueueTimeoutError):
+            with scheduler.slot("chat", PARAMS):
+                pass
+
+    set_user("alice")
+    with scheduler.slot("chat", PARAMS):
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        thread.join(2)
+    _assert_idle(scheduler)
+
+
+def test_aslot_cancelled_waiter_leaves_no_ticket():
+    scheduler = FairScheduler(max_concurrent=1, max_wait=5, poll=0.01)
+
+    async def waiter():
+        async with scheduler.aslot("chat", PARAMS):
+            pass
+
+    async def main():
+        set_user("bob")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(waiter(), 0.1)
+
+    set_user("alice")
+    with scheduler.slot("chat", PARAMS):
+        asyncio.run(main())
+        assert scheduler.status()["queued"] == 0
+    _assert_idle(scheduler)
+
+    async def again():
+        async with scheduler.aslot("chat", PARAMS):
+            return scheduler.status()["running"]
+
+    assert asyncio.run(again()) == 1
+    _assert_idle(scheduler)
+
+
+def test_fan_out_runs_its_calls_beyond_the_user_limit():
+    scheduler = FairScheduler(max_concurrent=8, user_concurrency=2, poll=0.01)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def call():
+        with scheduler.slot("chat", PARAMS):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+    def upload():
+        set_user("alice")
+        with fan_out(6):
+            threads = [threading.Thread(target=contextvars.copy_context().run, args=(call,)) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    upload()
+    assert peak[0] == 6
+    _assert_idle(scheduler)
@@ -0,0 +1,104 @@
+import os
+import time
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from storage import SQLiteBackend
+from user_directory import new_user_record
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "profiles.db")
+    backend = SQLiteBackend(path)
+    for username, name in (("alice", "Alice"), ("bob", "Bob")):
+        record = new_user_record({"username": username, "password": username})
+        record["profile"]["name"] = name
+        backend.save_users({username: record})
+    st.cache_resource.clear()
+    yield path
+    st.cache_resource.clear()
+
+
+def _session(db, username):
+    at = AppTest.from_file(MAIN, default_timeout=30)
+    for key, value in {"PROFILE_BACKEND": "sqlite", "PROFILE_DB_PATH": db, "OPENAI_API_KEY": "test",
+                       "SAVE_DEBOUNCE_SECONDS": 0}.items():
+        at.secrets[key] = value
+    at.run()
+    at.text_input[0].input(username)
+    at.text_input[1].input(username)
+    at.button[0].click()
+    at.run()
+    assert not at.exception
+    return at
+
+
+def _widget(at, label):
+    return next(w for w in at.text_input if w.label == label)
+
+
+def _type(at, label, value):
+    _widget(at, label).input(value)
+    at.run()
+    # Another rerun (any click elsewhere) renders the field with the edit as its
+    # default, so its value now lives only in the session's profile dict.
+    at.run()
+
+
+def _save(at, db, username, field, value):
+    next(b for b in at.button if b.label == "💾 Save Profile").click()
+    at.run()
+    # The write-behind queue saves on its own thread.
+    deadline = time.monotonic() + 5
+    while SQLiteBackend(db).load_user(username)["profile"][field] != value:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_another_users_save_keeps_unsaved_edits(db):
+    alice = _session(db, "alice")
+    bob = _session(db, "bob")
+    _type(alice, "Name", "Alice Smith")
+
+    _type(bob, "Name", "Robert")
+    _save(bob, db, "bob", "name", "Robert")
+    alice.run()
+
+    assert _widget(alice, "Name").value == "Alice Smith"
+    assert alice.session_state["profiles"]["alice"]["profile"]["name"] == "Alice Smith"
+
+
+def test_own_record_changed_elsewhere_merges_under_unsaved_edits(db):
+    alice = _session(db, "alice")
+    other = _session(db, "alice")
+    _type(alice, "Name", "Alice Smith")
+
+    _type(other, "Location", "Leeds")
+    _save(other, db, "alice", "location", "Leeds")
+    alice.run()
+
+    assert _widget(alice, "Name").value == "Alice Smith"
+    assert _widget(alice, "Location").value == "Leeds"
+
+
+def test_admin_takes_other_users_saves(db):
+    backend = SQLiteBackend(db)
+    record = backend.load_user("alice")
+    record["is_admin"] = True
+    backend.save_users({"alice": record})
+    alice = _session(db, "alice")
+    bob = _session(db, "bob")
+    _type(alice, "Name", "Alice Smith")
+
+    _type(bob, "Name", "Robert")
+    _save(bob, db, "bob", "name", "Robert")
+    alice.run()
+
+    assert alice.session_state["profiles"]["bob"]["profile"]["name"] == "Robert"
+    assert _widget(alice, "Name").value == "Alice Smith"
@@ -0,0 +1,165 @@
+from engine import new_profile_record
+from storage import PENDING_KEY, REV_KEY
+
+ROLES = ("pending", "user", "admin", "super_admin")
+
+
+def pending_requests(value):
+    # Signups used to be stored as a list of requests; they are now keyed by
+    # username so approving or denying one never rewrites the others.
+    if isinstance(value, list):
+        return {req["username"]: req for req in value if req.get("username")}
+    return {username: req for username, req in (value or {}).items() if username != REV_KEY}
+
+
+def role_of(record):
+    if record.get("super_admin"):
+        return "super_admin"
+    if record.get("is_admin"):
+        return "admin"
+    return "user"
+
+
+def new_user_record(request):
+    record = new_profile_record()
+    record["settings"] = {
+        "username": request["username"],
+        "password": request["password"],
+        "email": request.get("email", "")
+    }
+    record["is_admin"] = False
+    return record
+
+
+# ------------------ USER DIRECTORY ------------------
+class UserDirectory:
+    # Lightweight index over the profile store: one small entry per user and per
+    # pending signup, bucketed by role and kept sorted, so the admin screens can
+    # search and page through thousands of users without walking full records.
+    # Search results are memoised per (query, role) until the index changes.
+    def __init__(self, profiles=None):
+        self._entries = {}
+        self._by_role = {role: [] for role in ROLES}
+        self._dirty = set(ROLES)
+        self._results = {}
+        if profiles:
+            self.rebuild(profiles)
+
+    def rebuild(self, profiles):
+        self._entries = {}
+        for username, record in profiles.items():
+            if username == PENDING_KEY:
+                for request in pending_requests(record).values():
+                    self._put_pending(request)
+            elif isinstance(record, dict):
+                self._put_user(username, record)
+        self._dirty = set(ROLES)
+        self._results = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _index(self, key, entry):
+        self._remove(key)
+        entry["search"] = f"{entry['username']} {entry['email']} {entry['name']}".lower()
+        self._entries[key] = entry
+        self._dirty.add(entry["role"])
+
+    def _remove(self, key):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._dirty.add(old["role"])
+        self._results = {}
+
+    def _put_user(self, username, record):
+        settings = record.get("settings", {})
+        self._index(("user", username), {
+            "username": username,
+            "email": settings.get("email", ""),
+            "name": record.get("profile", {}).get("name", ""),
+            "role": role_of(record),
+        })
+
+    def _put_pending(self, request):
+        self._index(("pending", request["username"]), {
+            "username": request["username"],
+            "email": request.get("email", ""),
+            "name": "",
+            "role": "pending",
+        })
+
+    def refresh(self, profiles, keys):
+        # Re-index only the records that were just changed.
+        for key in keys:
+            if key == PENDING_KEY:
+                for entry_key in [k for k in self._entries if k[0] == "pending"]:
+                    self._remove(entry_key)
+                for request in pending_requests(profiles.get(PENDING_KEY)).values():
+                    self._put_pending(request)
+            elif isinstance(profiles.get(key), dict):
+                self._put_user(key, profiles[key])
+            else:
+                self._remove(("user", key))
+
+    def _role_entries(self, role):
+        if role in self._dirty:
+            self._by_role[role] = sorted(
+                (e for e in self._entries.values() if e["role"] == role), key=lambda e: e["username"]
+            )
+            self._dirty.discard(role)
+        return self._by_role[role]
+
+    def counts(self):
+        return {role: len(self._role_entries(role)) for role in ROLES}
+
+    def search(self, query="", roles=ROLES):
+        query = query.strip().lower()
+        key = (query, tuple(roles))
+        if key not in self._results:
+            matches = []
+            for role in roles:
+                matches.extend(e for e in self._role_entries(role) if not query or query in e["search"])
+            self._results[key] = matches
+        return self._results[key]
+
+    def page(self, query="", roles=ROLES, page=1, per_page=25):
+        # Returns (entries on this page, total matches, page count).
+        matches = self.search(query, roles)
+        pages = max(1, -(-len(matches) // per_page))
+        page = min(max(1, page), pages)
+        start = (page - 1) * per_page
+        return matches[start:start + per_page], len(matches), pages
+
+
+# ------------------ BULK ACTIONS ------------------
+def approve_signups(profiles, usernames):
+    # Returns the keys that changed so the caller can save them in one batch.
+    pending = pending_requests(profiles.get(PENDING_KEY))
+    changed = []
+    for username in usernames:
+        request = pending.pop(username, None)
+        if request is None or username in profiles:
+            continue
+        profiles[username] = new_user_record(request)
+        changed.append(username)
+    profiles[PENDING_KEY] = pending
+    return changed + [PENDING_KEY]
+
+
+def deny_signups(profiles, usernames):
+    pending = pending_requests(profiles.get(PENDING_KEY))
+    for username in usernames:
+        pending.pop(username, None)
+    profiles[PENDING_KEY] = pending
+    return [PENDING_KEY]
+
+
+def set_admin(profiles, usernames, is_admin):
+    changed = []
+    for username in usernames:
+        record = profiles.get(username)
+        if record is None or record.get("super_admin") or record.get("is_admin", False) == is_admin:
+            continue
+        record["is_admin"] = is_admin
+        changed.append(username)
+    return changed